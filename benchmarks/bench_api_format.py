@@ -0,0 +1,97 @@
+"""Benchmark of rendering a post from an API Media object
+
+"before" is the original path: serialize the Media into the manual
+"‣ Genres : ..." text, re-parse it with the big DOTALL regex, then
+render. "after" builds an AnimeRecord straight from the Media and
+renders it. Both must produce identical captions.
+
+    python benchmarks/bench_api_format.py
+"""
+import re
+
+from common import SYNOPSIS_SIZES, peak_allocation, print_table, sample_synopsis, time_per_call
+
+from bot import AnimeFormatter, AnimeRecord, format_date
+
+LEGACY_INPUT_PATTERN = re.compile(
+    r'(?P<title>.*?)\s*\n\s*\n?'
+    r'[‣•]\s*Genres\s*:\s*(?P<genres>.*?)\s*\n'
+    r'[‣•]\s*Type\s*:\s*(?P<type>.*?)\s*\n'
+    r'[‣•]\s*Average Rating\s*:\s*(?P<rating>.*?)\s*\n'
+    r'[‣•]\s*Status\s*:\s*(?P<status>.*?)\s*\n'
+    r'[‣•]\s*First aired\s*:\s*(?P<first_aired>.*?)\s*\n'
+    r'[‣•]\s*Last aired\s*:\s*(?P<last_aired>.*?)\s*\n'
+    r'[‣•]\s*Runtime\s*:\s*(?P<runtime>.*?)\s*\n'
+    r'[‣•]\s*No of episodes\s*:\s*(?P<episodes>.*?)\s*\n\s*\n?'
+    r'[‣•]\s*Synopsis\s*:\s*(?P<synopsis>.*)',
+    re.DOTALL | re.IGNORECASE
+)
+
+def sample_media(size):
+    synopsis = sample_synopsis(size).replace(" (Source: AniList)", "")
+    return {
+        "id": 154587,
+        "format": "TV",
+        "title": {"romaji": "Sousou no Frieren", "english": "Frieren: Beyond Journey's End"},
+        "episodes": 28,
+        "status": "FINISHED",
+        "startDate": {"year": 2023, "month": 9, "day": 29},
+        "endDate": {"year": 2024, "month": 3, "day": 22},
+        "duration": 24,
+        "averageScore": 91,
+        "genres": ["Adventure", "Drama", "Fantasy"],
+        "description": synopsis.replace(". ", ".<br><br>\n"),
+        "siteUrl": "https://anilist.co/anime/154587",
+    }
+
+def legacy_format(formatter, anime, anime_id):
+    title = anime["title"]["english"] or anime["title"]["romaji"]
+    description = anime.get("description", "No synopsis available.")
+    description = re.sub(r'<.*?>', '', description)
+    description = description.replace('\n', ' ').strip()
+    episodes = str(anime.get("episodes", "—")) if anime.get("episodes") else "—"
+    cover_url = f"https://img.anili.st/media/{anime_id}"
+
+    manual_format_text = f"""{title}
+
+‣ Genres : {', '.join(anime.get('genres', ['Sample']))}
+‣ Type : {anime.get('format', 'TV')}
+‣ Average Rating : {anime.get('averageScore', '100')}
+‣ Status : {anime.get('status', 'Unknown').replace('_', ' ')}
+‣ First aired : {format_date(anime.get('startDate', {}))}
+‣ Last aired : {format_date(anime.get('endDate', {}))}
+‣ Runtime : {anime.get('duration', '24')} min
+‣ No of episodes : {episodes}
+
+‣ Synopsis : {description}
+
+(Source: AniList)"""
+
+    match = LEGACY_INPUT_PATTERN.search(manual_format_text.strip())
+    data = {k: (v.strip() if v else "") for k, v in match.groupdict().items()}
+    return formatter.format_html(AnimeRecord(**data), cover_url, anime_id)
+
+def direct_format(formatter, anime, anime_id):
+    return formatter.format_html(AnimeRecord.from_media(anime), anime_id=anime_id)
+
+def main():
+    formatter = AnimeFormatter()
+    rows = []
+    for size in SYNOPSIS_SIZES:
+        anime = sample_media(size)
+        before = legacy_format(formatter, anime, anime["id"])
+        after = direct_format(formatter, anime, anime["id"])
+        assert before == after, f"rendered post differs for {size} chars"
+
+        old_us = time_per_call(legacy_format, formatter, anime, anime["id"])
+        new_us = time_per_call(direct_format, formatter, anime, anime["id"])
+        rows.append((
+            size, f"{old_us:.1f}", f"{new_us:.1f}", f"{old_us / new_us:.1f}x",
+            f"{peak_allocation(legacy_format, formatter, anime, anime['id']):.0f}",
+            f"{peak_allocation(direct_format, formatter, anime, anime['id']):.0f}",
+        ))
+
+    print_table(("description chars", "before us", "after us", "speedup", "before peak B", "after peak B"), rows)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark of batch formatting: inline on the event loop vs the FormattingPool
+
+Renders batches of API Media objects (as /bulk does) with each
+FORMAT_EXECUTOR mode and reports posts/s plus the worst event-loop stall
+seen by a 1 ms ticker running alongside, which is what other users'
+updates feel while a batch is formatted. Process-pool numbers only beat
+inline with more than one core available.
+
+    python benchmarks/bench_format_pool.py
+    python benchmarks/bench_format_pool.py --workers 4 --batches 10 50 200
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import print_table
+from mock_services import make_catalog
+
+import bot
+
+async def measure(mode, workers, media, rounds):
+    pool = bot.FormattingPool(mode=mode, workers=workers, offload_min=1)
+    pool.start()
+    await pool.map(bot.render_media, media[:workers])  # start the workers outside the timing
+
+    worst_stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal worst_stall
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            worst_stall = max(worst_stall, time.perf_counter() - started - 0.001)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    try:
+        started = time.perf_counter()
+        for _ in range(rounds):
+            results = await pool.map(bot.render_media, media)
+        elapsed = time.perf_counter() - started
+    finally:
+        running = False
+        await tick
+        await pool.close()
+
+    assert results == [bot.render_media(m) for m in media]
+    return len(media) * rounds / elapsed, worst_stall * 1000
+
+async def run(args):
+    catalog = list(make_catalog(max(args.batches)).values())
+    rows = []
+    for size in args.batches:
+        media = catalog[:size]
+        rounds = max(1, 400 // size)
+        for mode in ("inline", "thread", "process"):
+            rate, stall = await measure(mode, args.workers, media, rounds)
+            rows.append((size, mode, f"{rate:.0f}", f"{stall:.1f}"))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch formatting throughput per FORMAT_EXECUTOR mode")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--batches", type=int, nargs="+", default=[10, 50, 200])
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s), {args.workers} workers\n")
+    print_table(("batch", "mode", "posts/s", "worst loop stall ms"), asyncio.run(run(args)))
+
+if __name__ == "__main__":
+    main()
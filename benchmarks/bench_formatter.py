@@ -0,0 +1,100 @@
+"""Micro-benchmark for AnimeFormatter's text transforms
+
+Compares the original per-call implementations (dict rebuilt on every
+call, regexes compiled on every call, char-by-char loop) against the
+precompiled / str.translate versions in bot.py, for synopses from
+500 chars up to 10 KB.
+
+    python benchmarks/bench_formatter.py
+"""
+import re
+
+from common import SYNOPSIS_SIZES, peak_allocation, print_table, sample_synopsis, time_per_call
+
+from bot import AnimeFormatter
+
+def legacy_convert_to_small_caps(text):
+    if not text:
+        return ""
+    small_caps_map = {
+        'a': 'ᴀ', 'b': 'ʙ', 'c': 'ᴄ', 'd': 'ᴅ', 'e': 'ᴇ', 'f': 'ғ',
+        'g': 'ɢ', 'h': 'ʜ', 'i': 'ɪ', 'j': 'ᴊ', 'k': 'ᴋ', 'l': 'ʟ',
+        'm': 'ᴍ', 'n': 'ɴ', 'o': 'ᴏ', 'p': 'ᴘ', 'q': 'ǫ', 'r': 'ʀ',
+        's': 's', 't': 'ᴛ', 'u': 'ᴜ', 'v': 'ᴠ', 'w': 'ᴡ', 'x': 'x',
+        'y': 'ʏ', 'z': 'ᴢ',
+        'A': 'ᴀ', 'B': 'ʙ', 'C': 'ᴄ', 'D': 'ᴅ', 'E': 'ᴇ', 'F': 'ғ',
+        'G': 'ɢ', 'H': 'ʜ', 'I': 'ɪ', 'J': 'ᴊ', 'K': 'ᴋ', 'L': 'ʟ',
+        'M': 'ᴍ', 'N': 'ɴ', 'O': 'ᴏ', 'P': 'ᴘ', 'Q': 'ǫ', 'R': 'ʀ',
+        'S': 's', 'T': 'ᴛ', 'U': 'ᴜ', 'V': 'ᴠ', 'W': 'ᴡ', 'X': 'x',
+        'Y': 'ʏ', 'Z': 'ᴢ'
+    }
+    result = []
+    for char in text:
+        if char in small_caps_map:
+            result.append(small_caps_map[char])
+        else:
+            result.append(char)
+    return ''.join(result)
+
+def legacy_truncate_synopsis(synopsis, max_chars=500):
+    if not synopsis:
+        return ""
+    synopsis = re.sub(r'\(Source:.*?\)', '', synopsis, flags=re.IGNORECASE | re.DOTALL).strip()
+    if len(synopsis) > max_chars:
+        synopsis = synopsis[:max_chars].rstrip() + "..."
+    return legacy_convert_to_small_caps(synopsis)
+
+def legacy_extract_episode_count(episodes_text):
+    if not episodes_text:
+        return "—"
+    numbers = re.findall(r'\d+', episodes_text)
+    if numbers:
+        return numbers[-1]
+    if re.search(r'\b(ongoing|airing|tba)\b', episodes_text, re.IGNORECASE):
+        return "—"
+    return "—"
+
+def legacy_strip_tags(description):
+    return re.sub(r'<.*?>', '', description)
+
+def main():
+    formatter = AnimeFormatter()
+    cases = [
+        ("small_caps", legacy_convert_to_small_caps, formatter.convert_to_small_caps, None),
+        ("truncate_synopsis", legacy_truncate_synopsis, formatter.truncate_synopsis, None),
+        ("strip_tags", legacy_strip_tags, formatter.strip_html_tags, "html"),
+    ]
+
+    rows = []
+    for size in SYNOPSIS_SIZES:
+        synopsis = sample_synopsis(size)
+        html = synopsis.replace(". ", ".<br><i>x</i> ")
+        for name, old, new, kind in cases:
+            text = html if kind == "html" else synopsis
+            assert old(text) == new(text), f"{name} output changed for {size} chars"
+            old_us = time_per_call(old, text)
+            new_us = time_per_call(new, text)
+            rows.append((
+                name, size,
+                f"{old_us:.1f}", f"{new_us:.1f}", f"{old_us / new_us:.1f}x",
+                f"{peak_allocation(old, text):.0f}", f"{peak_allocation(new, text):.0f}",
+            ))
+
+    for episodes in ("12", "24 episodes", "Ongoing", "TBA (2 cours, 25 eps)"):
+        assert legacy_extract_episode_count(episodes) == formatter.extract_episode_count(episodes)
+        old_us = time_per_call(legacy_extract_episode_count, episodes)
+        new_us = time_per_call(formatter.extract_episode_count, episodes)
+        rows.append((
+            "episode_count", len(episodes),
+            f"{old_us:.2f}", f"{new_us:.2f}", f"{old_us / new_us:.1f}x",
+            f"{peak_allocation(legacy_extract_episode_count, episodes):.0f}",
+            f"{peak_allocation(formatter.extract_episode_count, episodes):.0f}",
+        ))
+
+    print_table(
+        ("transform", "chars", "before us", "after us", "speedup", "before peak B", "after peak B"),
+        rows
+    )
+
+if __name__ == "__main__":
+    main()
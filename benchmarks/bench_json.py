@@ -0,0 +1,109 @@
+"""Benchmark of decoding GraphQL responses
+
+"before" is the original path: response.text() turns the body into a
+str, then stdlib json.loads parses it. "after" parses the raw bytes with
+bot.json_loads (orjson when installed, stdlib otherwise). The first
+table times decoding alone for search/detail payloads of 10 and 50
+items; the second measures process CPU per request end to end against
+the mock GraphQL server (client and mock share the process, so compare
+the columns rather than reading them as absolute client cost).
+
+    python benchmarks/bench_json.py
+    python benchmarks/bench_json.py --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from common import print_table, time_per_call
+from mock_services import MockGraphQLServer, make_catalog, project
+
+import bot
+
+def sample_payloads():
+    catalog = list(make_catalog(50).values())
+    list_query = bot.GRAPHQL_QUERIES["search_list"]
+    detail_query = bot.GRAPHQL_QUERIES["search_detail"]
+    page_info = {"total": 500, "currentPage": 1, "lastPage": 50, "hasNextPage": True}
+
+    def page(items, query):
+        media = [project(m, query) for m in catalog[:items]]
+        return json.dumps({"data": {"Page": {"pageInfo": page_info, "media": media}}}).encode()
+
+    return [
+        ("list x10", page(10, list_query)),
+        ("detail x10", page(10, detail_query)),
+        ("detail x50", page(50, detail_query)),
+        ("media x1", json.dumps({"data": {"Media": catalog[0]}}).encode()),
+    ]
+
+def legacy_decode(body):
+    return json.loads(body.decode("utf-8"))
+
+class LegacyAnimeSearch(bot.AnimeSearch):
+    """The original _post_graphql body handling: text(), then json.loads"""
+
+    async def _post_graphql(self, url, query, variables, extensions=None):
+        if self._session is None or self._session.closed:
+            await self.start()
+        async with self._session.post(url, json={"query": query, "variables": variables}) as response:
+            body = await response.text()
+            if response.status != 200:
+                return None
+        return json.loads(body)
+
+async def cpu_per_request(search_class, url, query, variables, requests):
+    search = search_class()
+    search.endpoints = [bot.GraphQLEndpoint(url, 0)]
+    await search.start()
+    try:
+        await search._post_graphql(url, query, variables)  # open a pooled connection first
+        cpu = time.process_time()
+        for _ in range(requests):
+            result = await search._post_graphql(url, query, variables)
+            assert result and "data" in result
+        return (time.process_time() - cpu) / requests * 1e6
+    finally:
+        await search.close()
+
+async def end_to_end(requests):
+    server = MockGraphQLServer(catalog_size=500, latency=0)
+    url = await server.start()
+    cases = [
+        ("search list x10", bot.GRAPHQL_QUERIES["search_list"], {"search": "the", "page": 1, "perPage": 10}),
+        ("search detail x10", bot.GRAPHQL_QUERIES["search_detail"], {"search": "the", "page": 1, "perPage": 10}),
+        ("search detail x50", bot.GRAPHQL_QUERIES["search_detail"], {"search": "the", "page": 1, "perPage": 50}),
+        ("media detail", bot.GRAPHQL_QUERIES["media_detail"], {"id": 7}),
+    ]
+    rows = []
+    try:
+        for name, query, variables in cases:
+            old = await cpu_per_request(LegacyAnimeSearch, url, query, variables, requests)
+            new = await cpu_per_request(bot.AnimeSearch, url, query, variables, requests)
+            rows.append((name, f"{old:.0f}", f"{new:.0f}", f"{old / new:.2f}x"))
+    finally:
+        await server.stop()
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="GraphQL response decoding: before vs after")
+    parser.add_argument("--requests", type=int, default=500, help="requests per end-to-end case")
+    args = parser.parse_args()
+
+    backend = "orjson" if bot.orjson is not None else "stdlib json (install orjson for the fast path)"
+    print(f"json_loads backend: {backend}\n")
+
+    rows = []
+    for name, body in sample_payloads():
+        assert legacy_decode(body) == bot.json_loads(body)
+        old_us = time_per_call(legacy_decode, body)
+        new_us = time_per_call(bot.json_loads, body)
+        rows.append((name, f"{len(body) / 1024:.1f}", f"{old_us:.1f}", f"{new_us:.1f}", f"{old_us / new_us:.1f}x"))
+    print_table(("payload", "KB", "before us", "after us", "speedup"), rows)
+
+    print()
+    print_table(("request", "before CPU us/req", "after CPU us/req", "speedup"), asyncio.run(end_to_end(args.requests)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Fuzz and worst-case benchmark for the manual-format parser
+
+1. Well-formed messages: the line parser must agree with the original
+   DOTALL regex field for field, also when bulleted lines with labels it
+   doesn't know ("‣ Studios : ...") are mixed in; those must be dropped,
+   never glued onto the previous field.
+2. Fuzzing: thousands of mutated messages (dropped, reordered, duplicated
+   or garbled lines, stray bullets, unknown labels, huge synopses). The
+   parser may only return a record or raise AnimeParseError, no unknown
+   label may leak into a field before the synopsis, and no single input
+   may take longer than --budget-ms.
+3. Worst case: a message missing "Runtime" with synopses from 1 KB up
+   to --max-kb, timed for the old regex and the new parser. The old
+   regex grows quadratically here (64 KB takes minutes).
+
+    python benchmarks/bench_parser.py [--cases 5000] [--budget-ms 5] [--max-kb 16]
+"""
+import argparse
+import random
+import re
+import time
+
+from common import print_table, sample_synopsis
+
+from bot import AnimeFormatter, AnimeParseError
+
+LEGACY_INPUT_PATTERN = re.compile(
+    r'(?P<title>.*?)\s*\n\s*\n?'
+    r'[‣•]\s*Genres\s*:\s*(?P<genres>.*?)\s*\n'
+    r'[‣•]\s*Type\s*:\s*(?P<type>.*?)\s*\n'
+    r'[‣•]\s*Average Rating\s*:\s*(?P<rating>.*?)\s*\n'
+    r'[‣•]\s*Status\s*:\s*(?P<status>.*?)\s*\n'
+    r'[‣•]\s*First aired\s*:\s*(?P<first_aired>.*?)\s*\n'
+    r'[‣•]\s*Last aired\s*:\s*(?P<last_aired>.*?)\s*\n'
+    r'[‣•]\s*Runtime\s*:\s*(?P<runtime>.*?)\s*\n'
+    r'[‣•]\s*No of episodes\s*:\s*(?P<episodes>.*?)\s*\n\s*\n?'
+    r'[‣•]\s*Synopsis\s*:\s*(?P<synopsis>.*)',
+    re.DOTALL | re.IGNORECASE
+)
+
+FIELD_LINES = [
+    "‣ Genres : Action, Sci-Fi",
+    "‣ Type : TV",
+    "‣ Average Rating : 82",
+    "‣ Status : FINISHED",
+    "‣ First aired : 2024-4-13",
+    "‣ Last aired : 2024-6-29",
+    "‣ Runtime : 24 minutes",
+    "‣ No of episodes : 12",
+]
+
+# Labels the parser doesn't know; the value marks any leak into another field
+UNKNOWN_LABEL_VALUE = "Madhouse 2"
+UNKNOWN_FIELD_LINES = [f"‣ Studios : {UNKNOWN_LABEL_VALUE}", f"• Season : {UNKNOWN_LABEL_VALUE}"]
+
+def build_message(title, synopsis, field_lines=FIELD_LINES, blank_after_title=True):
+    lines = [title]
+    if blank_after_title:
+        lines.append("")
+    lines.extend(field_lines)
+    lines.append("")
+    lines.append(f"‣ Synopsis : {synopsis}")
+    return "\n".join(lines)
+
+def legacy_parse(text):
+    match = LEGACY_INPUT_PATTERN.search(text.strip())
+    if not match:
+        return None
+    return {k: (v.strip() if v else "") for k, v in match.groupdict().items()}
+
+def check_equivalence(formatter, rng, cases):
+    for i in range(cases):
+        size = rng.choice((50, 500, 2000))
+        synopsis = sample_synopsis(size, seed=i)
+        if rng.random() < 0.5:
+            synopsis = synopsis.replace(". ", ".\n", 3)
+        title = rng.choice(("Frieren", "Jujutsu Kaisen | 呪術廻戦", "Re:Zero − Starting Life"))
+        blank_after_title = rng.random() < 0.7
+        expected = legacy_parse(build_message(title, synopsis, blank_after_title=blank_after_title))
+
+        field_lines = list(FIELD_LINES)
+        if rng.random() < 0.5:
+            # The legacy regex rejects these; the parser must ignore them
+            for line in rng.sample(UNKNOWN_FIELD_LINES, rng.randint(1, 2)):
+                field_lines.insert(rng.randint(0, len(field_lines)), line)
+        text = build_message(title, synopsis, field_lines=field_lines, blank_after_title=blank_after_title)
+
+        record = formatter.parse_anime_record(text)
+        got = {k: getattr(record, k) for k in expected}
+        assert got == expected, f"parser disagrees with legacy regex on case {i}:\n{got}\n{expected}"
+
+def mutate(rng, text):
+    lines = text.split("\n")
+    for _ in range(rng.randint(1, 6)):
+        op = rng.randrange(7)
+        index = rng.randrange(len(lines)) if lines else 0
+        if op == 0 and lines:
+            del lines[index]
+        elif op == 1:
+            rng.shuffle(lines)
+        elif op == 2 and lines:
+            lines.insert(index, lines[index])
+        elif op == 3:
+            lines.insert(index, rng.choice(("‣", "•", "‣ :", ": :", "‣ Unknown : x", "   ", "‣‣‣ Genres",
+                                            *UNKNOWN_FIELD_LINES)))
+        elif op == 4:
+            lines.insert(index, "‣ Synopsis : " + "x" * rng.randint(0, 20000))
+        elif op == 5 and lines:
+            lines[index] = "".join(rng.sample(lines[index], len(lines[index])))
+        elif op == 6:
+            lines.insert(index, "\n" * rng.randint(1, 50))
+    return "\n".join(lines)
+
+FIELD_NAMES = ("genres", "type", "rating", "status", "first_aired", "last_aired", "runtime", "episodes")
+
+def fuzz(formatter, rng, cases, budget_ms):
+    worst = 0.0
+    outcomes = {"record": 0, "missing": 0}
+    base = build_message("Frieren", sample_synopsis(4000))
+    for _ in range(cases):
+        text = mutate(rng, base)
+        start = time.perf_counter()
+        try:
+            record = formatter.parse_anime_record(text)
+            outcomes["record"] += 1
+        except AnimeParseError:
+            record = None
+            outcomes["missing"] += 1
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if record is not None:
+            leaked = [name for name in FIELD_NAMES if UNKNOWN_LABEL_VALUE in getattr(record, name)]
+            assert not leaked, f"unknown label leaked into {leaked}:\n{text[:2000]}"
+        worst = max(worst, elapsed_ms / max(1, len(text) / 4096))
+        assert elapsed_ms < budget_ms * max(1, len(text) / 4096), (
+            f"parse took {elapsed_ms:.2f} ms for {len(text)} chars"
+        )
+    return worst, outcomes
+
+def worst_case(formatter, max_kb):
+    rows = []
+    fields = [line for line in FIELD_LINES if "Runtime" not in line]
+    for kb in (kb for kb in (1, 4, 16, 64) if kb <= max_kb):
+        # Many short lines give the lazy groups the most places to retry
+        synopsis = sample_synopsis(kb * 1024).replace(" ", "\n", kb * 64)
+        text = build_message("Frieren", synopsis, field_lines=fields)
+
+        start = time.perf_counter()
+        assert legacy_parse(text) is None
+        legacy_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        record = formatter.parse_anime_record(text)
+        new_ms = (time.perf_counter() - start) * 1000
+        assert record.runtime == ""
+
+        rows.append((f"{kb} KB", f"{legacy_ms:.2f}", f"{new_ms:.3f}", f"{legacy_ms / new_ms:.0f}x"))
+    print_table(("synopsis (no Runtime)", "regex ms", "line parser ms", "speedup"), rows)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--cases", type=int, default=5000)
+    parser.add_argument("--budget-ms", type=float, default=5.0, help="max parse time per 4 KB of input")
+    parser.add_argument("--max-kb", type=int, default=16, help="largest synopsis for the worst-case table")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    formatter = AnimeFormatter()
+    rng = random.Random(args.seed)
+
+    check_equivalence(formatter, rng, 500)
+    print("equivalence with the legacy regex: OK (500 well-formed messages)")
+
+    worst, outcomes = fuzz(formatter, rng, args.cases, args.budget_ms)
+    print(f"fuzz: {args.cases} inputs, {outcomes}, worst {worst:.3f} ms per 4 KB (budget {args.budget_ms} ms)")
+    print()
+
+    worst_case(formatter, args.max_kb)
+
+if __name__ == "__main__":
+    main()
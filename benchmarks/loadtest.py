@@ -0,0 +1,277 @@
+"""Offline load test: replay synthetic updates through the real bot
+
+Starts a mock GraphQL API and a fake Bot API on 127.0.0.1, points the bot
+at them through its env config, then feeds a mix of search / page /
+select / manual-format / bulk updates from many simulated users into the
+application's update queue. Reports throughput, end-to-end latency
+percentiles per update kind and memory growth. No network access needed.
+
+    python benchmarks/loadtest.py --users 200 --updates 5000
+    python benchmarks/loadtest.py --rate 300 --graphql-latency 120 --graphql-error-rate 0.02
+"""
+import argparse
+import asyncio
+import gc
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from common import print_table
+from mock_services import FakeTelegramServer, MockGraphQLServer
+
+import updates
+
+KINDS = ("search", "page", "select", "manual", "inline", "bulk")
+
+def rss_bytes():
+    """Current resident set size (falls back to the peak where /proc is missing)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+def build_queries(graphql, count, rng):
+    """Search terms that hit the fake catalog, most popular first"""
+    titles = graphql.titles()
+    queries = []
+    while len(queries) < count:
+        words = rng.choice(titles).split()[:-1]
+        start = rng.randrange(len(words))
+        term = " ".join(words[start:start + rng.randint(1, 2)]).lower()
+        if term not in queries:
+            queries.append(term)
+    return queries
+
+def build_scenario(graphql, args, rng):
+    """(kind, update dict) pairs; each user's updates keep their relative order"""
+    queries = build_queries(graphql, args.queries, rng)
+    popularity = [1 / (rank + 1) for rank in range(len(queries))]
+    weights = [args.search_weight, args.page_weight, args.select_weight, args.manual_weight, args.inline_weight,
+               args.bulk_weight]
+    state = {}
+    scenario = []
+
+    while len(scenario) < args.updates:
+        user_id = 10_000 + rng.randrange(args.users)
+        session = state.get(user_id)
+        kind = "search" if session is None else rng.choices(KINDS, weights)[0]
+
+        if kind == "search":
+            query = rng.choices(queries, popularity)[0]
+            matches = graphql._search(query)
+            state[user_id] = session = {"matches": matches, "last_page": max(1, -(-len(matches) // 10)), "page": 1}
+            if len(query) > 4 and rng.random() < args.typo_rate:
+                typo = rng.randrange(1, len(query) - 1)
+                query = query[:typo] + query[typo + 1:]
+            scenario.append((kind, updates.search_update(user_id, query)))
+        elif kind == "page":
+            session["page"] = rng.randint(1, session["last_page"])
+            scenario.append((kind, updates.page_update(user_id, session["page"])))
+        elif kind == "select":
+            start = (session["page"] - 1) * 10
+            shown = session["matches"][start:start + 10] or session["matches"] or [graphql.catalog[1]]
+            scenario.append((kind, updates.select_update(user_id, rng.choice(shown)["id"])))
+        elif kind == "bulk":
+            # A few known titles, sometimes with one that matches nothing (a 404 alias upstream)
+            items = [rng.choice(graphql.titles()) for _ in range(rng.randint(2, 5))]
+            if rng.random() < 0.5:
+                items.insert(rng.randrange(len(items) + 1), f"no such anime {rng.randrange(10**6)}")
+            scenario.append((kind, updates.bulk_update(user_id, items)))
+        elif kind == "inline":
+            # One update per keystroke, as Telegram sends them while the user types
+            query = rng.choices(queries, popularity)[0]
+            for end in range(3, len(query) + 1):
+                scenario.append((kind, updates.inline_query_update(user_id, query[:end])))
+        else:
+            media = graphql.catalog[rng.randint(1, len(graphql.catalog))]
+            scenario.append((kind, updates.manual_format_update(
+                user_id, media["title"]["romaji"], media["description"].replace("<br>", " ")
+            )))
+    return scenario[:args.updates]
+
+async def run(args):
+    rng = random.Random(args.seed)
+    graphql = MockGraphQLServer(
+        catalog_size=args.catalog,
+        latency=args.graphql_latency / 1000,
+        error_rate=args.graphql_error_rate,
+        seed=args.seed,
+        persisted_queries=args.persisted_queries,
+    )
+    telegram = FakeTelegramServer(
+        latency=args.telegram_latency / 1000,
+        photo_error_rate=args.photo_error_rate,
+        seed=args.seed,
+    )
+    await graphql.start()
+    await telegram.start()
+    workdir = tempfile.mkdtemp(prefix="animebot-loadtest-")
+
+    # bot.py reads its config at import time
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "GRAPHQL_API_URLS": graphql.url,
+        "TELEGRAM_API_BASE_URL": telegram.base_url,
+        "TELEGRAM_API_FILE_URL": telegram.file_url,
+        "METRICS_PORT": "0",
+        "COVER_DB_PATH": os.path.join(workdir, "covers.sqlite3") if args.persist else "",
+        "SESSION_BACKEND": "sqlite" if args.persist else "memory",
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.sqlite3"),
+        "GRAPHQL_RATE_LIMIT": str(args.graphql_rate_limit),
+        "CATALOG_ENABLED": "1" if args.local_catalog else "0",
+        "CATALOG_PATH": os.path.join(workdir, "catalog.json.gz"),
+        "GRAPHQL_PERSISTED_QUERIES": "1" if args.persisted_queries else "0",
+    })
+    import bot
+
+    logging.getLogger().setLevel(args.log_level)
+    telegram_bot = bot.TelegramBot()
+    application = telegram_bot.application
+
+    # Record when each update finishes, including its time spent waiting on locks
+    finished = {}
+    all_done = asyncio.Event()
+    processor = telegram_bot.update_processor
+    do_process_update = processor.do_process_update
+
+    async def timed_process_update(update, coroutine):
+        try:
+            await do_process_update(update, coroutine)
+        finally:
+            finished[update.update_id] = time.perf_counter()
+            if len(finished) >= len(scenario):
+                all_done.set()
+
+    processor.do_process_update = timed_process_update
+
+    errors = Counter()
+
+    async def count_error(update, context):
+        errors[type(context.error).__name__] += 1
+
+    application.add_error_handler(count_error)
+
+    scenario = build_scenario(graphql, args, rng)
+    prepared = [(kind, bot.Update.de_json(data, application.bot)) for kind, data in scenario]
+
+    await application.initialize()
+    await telegram_bot._post_init(application)
+    await application.start()
+    if telegram_bot.catalog is not None:
+        # Let the first snapshot finish so the run measures the steady state
+        while not len(telegram_bot.catalog):
+            await asyncio.sleep(0.05)
+
+    gc.collect()
+    rss_before = rss_bytes()
+    objects_before = len(gc.get_objects())
+    rss_peak = rss_before
+
+    enqueued = {}
+    interval = 1 / args.rate if args.rate else 0
+    started = time.perf_counter()
+    for i, (kind, update) in enumerate(prepared):
+        if interval:
+            delay = started + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        enqueued[update.update_id] = time.perf_counter()
+        await application.update_queue.put(update)
+        if i % 500 == 0:
+            rss_peak = max(rss_peak, rss_bytes())
+
+    try:
+        await asyncio.wait_for(all_done.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"Timed out with {len(scenario) - len(finished)} updates still in flight")
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    rss_after = rss_bytes()
+    rss_peak = max(rss_peak, rss_after)
+    objects_after = len(gc.get_objects())
+    search_stats = telegram_bot.anime_search.stats()
+    render_stats = telegram_bot.render_cache.stats()
+
+    await application.stop()
+    await application.shutdown()
+    await telegram_bot._post_shutdown(application)
+    await telegram.stop()
+    await graphql.stop()
+
+    latencies = defaultdict(list)
+    for kind, update in prepared:
+        done = finished.get(update.update_id)
+        if done is not None:
+            latency = (done - enqueued[update.update_id]) * 1000
+            latencies[kind].append(latency)
+            latencies["all"].append(latency)
+
+    print(f"\n{len(finished)}/{len(prepared)} updates from {args.users} users in {elapsed:.2f}s "
+          f"-> {len(finished) / elapsed:.1f} updates/s")
+    print()
+    rows = []
+    for kind in (*KINDS, "all"):
+        values = latencies.get(kind)
+        if values:
+            rows.append((kind, len(values), f"{percentile(values, 50):.1f}", f"{percentile(values, 95):.1f}",
+                         f"{percentile(values, 99):.1f}", f"{max(values):.1f}"))
+    print_table(("kind", "count", "p50 ms", "p95 ms", "p99 ms", "max ms"), rows)
+
+    mib = 1024 * 1024
+    print(f"\nRSS: {rss_before / mib:.1f} MiB -> {rss_after / mib:.1f} MiB "
+          f"(growth {(rss_after - rss_before) / mib:+.1f} MiB, peak {rss_peak / mib:.1f} MiB); "
+          f"gc objects {objects_before} -> {objects_after} ({objects_after - objects_before:+d})")
+    print(f"GraphQL upstream requests: {dict(graphql.requests)} ({graphql.bytes_received / mib:.2f} MiB received, {graphql.bytes_sent / mib:.1f} MiB sent)")
+    print(f"Bot API calls: {dict(telegram.calls)}")
+    print(f"Cache: {search_stats['cache']}, coalesced: {search_stats['coalesced']}")
+    print(f"Render cache: {render_stats}")
+    if search_stats["catalog"] is not None:
+        print(f"Local catalog: {search_stats['catalog']}")
+    if errors:
+        print(f"Handler errors: {dict(errors)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay synthetic updates against mock GraphQL and Bot APIs")
+    parser.add_argument("--users", type=int, default=200, help="simulated users")
+    parser.add_argument("--updates", type=int, default=5000, help="total updates to replay")
+    parser.add_argument("--rate", type=float, default=0, help="arrival rate in updates/s (0 = all at once)")
+    parser.add_argument("--queries", type=int, default=300, help="distinct search terms (Zipf popularity)")
+    parser.add_argument("--catalog", type=int, default=2000, help="anime in the mock catalog")
+    parser.add_argument("--search-weight", type=float, default=0.3)
+    parser.add_argument("--page-weight", type=float, default=0.2)
+    parser.add_argument("--select-weight", type=float, default=0.35)
+    parser.add_argument("--manual-weight", type=float, default=0.15)
+    parser.add_argument("--inline-weight", type=float, default=0.0, help="inline typing sessions (one update per keystroke)")
+    parser.add_argument("--bulk-weight", type=float, default=0.03, help="/bulk title lists, some with a miss")
+    parser.add_argument("--typo-rate", type=float, default=0.0, help="share of searches with a dropped letter")
+    parser.add_argument("--graphql-latency", type=float, default=50, help="mean mock GraphQL latency in ms")
+    parser.add_argument("--graphql-error-rate", type=float, default=0.0)
+    parser.add_argument("--graphql-rate-limit", type=float, default=0,
+                        help="bot-side GraphQL rate limit in req/s (0 = off, so the mock sets the pace)")
+    parser.add_argument("--telegram-latency", type=float, default=10, help="fake Bot API latency in ms")
+    parser.add_argument("--photo-error-rate", type=float, default=0.0)
+    parser.add_argument("--local-catalog", action="store_true", help="answer searches from a local catalog snapshot")
+    parser.add_argument("--persisted-queries", action="store_true", help="send query hashes (mock accepts APQ)")
+    parser.add_argument("--persist", action="store_true", help="use SQLite cover and session stores in a temp dir")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""Offline load test of BOT_MODE=sharded: ingress + worker processes over HTTP
+
+Starts the mock GraphQL API and fake Bot API, then for each worker count
+runs a ShardRouter (which spawns the TelegramBot workers) and POSTs the
+same synthetic updates to its webhook, each user's in order. Reports
+updates/s until every worker has drained its queue, plus upstream calls
+and how many local cache misses the shared SQLite cache answered. Only
+scales with more than one core available.
+
+    python benchmarks/loadtest_sharded.py --workers 1 2 4
+    python benchmarks/loadtest_sharded.py --workers 4 --updates 10000 --graphql-latency 100
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from common import print_table
+from loadtest import build_scenario
+from mock_services import FakeTelegramServer, MockGraphQLServer
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def wait_drained(session, health_url, expected, timeout):
+    """Poll the ingress until every worker has received and finished `expected` updates"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        async with session.get(health_url) as response:
+            health = await response.json()
+        workers = [w for w in health["workers"] if w]
+        received = sum(w["received"] for w in workers)
+        busy = sum(w["pending_updates"] + w["queued_updates"] + w["active_updates"] for w in workers)
+        if received >= expected and not busy:
+            return health
+        await asyncio.sleep(0.05)
+    print(f"Timed out with {expected - received} updates not received, {busy} in progress")
+    return health
+
+async def run_once(bot, workers, scenario, args):
+    graphql = MockGraphQLServer(catalog_size=args.catalog, latency=args.graphql_latency / 1000, seed=args.seed)
+    telegram = FakeTelegramServer(latency=args.telegram_latency / 1000, seed=args.seed)
+    await graphql.start()
+    await telegram.start()
+    workdir = tempfile.mkdtemp(prefix="animebot-sharded-")
+
+    # Workers are spawned, so they read their config from the environment
+    os.environ.update({
+        "GRAPHQL_API_URLS": graphql.url,
+        "TELEGRAM_API_BASE_URL": telegram.base_url,
+        "TELEGRAM_API_FILE_URL": telegram.file_url,
+        "COVER_DB_PATH": os.path.join(workdir, "covers.sqlite3"),
+        "SESSION_DB_PATH": os.path.join(workdir, "sessions.sqlite3"),
+        "SHARED_CACHE_PATH": os.path.join(workdir, "cache.sqlite3"),
+    })
+    port = free_port()
+    router = bot.ShardRouter(workers=workers, socket_dir=os.path.join(workdir, "sockets"),
+                             listen="127.0.0.1", port=port, secret="")
+    await router.start()
+
+    by_user = defaultdict(list)
+    for _, update in scenario:
+        body = next(value for key, value in update.items() if key != "update_id")
+        by_user[body["from"]["id"]].append(update)
+
+    url = f"http://127.0.0.1:{port}{router.path}"
+    limit = asyncio.Semaphore(args.connections)
+    statuses = defaultdict(int)
+
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.connections)) as session:
+        async def send_user(updates):
+            for update in updates:
+                async with limit:
+                    async with session.post(url, json=update) as response:
+                        statuses[response.status] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send_user(updates) for updates in by_user.values()))
+        health = await wait_drained(session, f"http://127.0.0.1:{port}/healthz", len(scenario), args.timeout)
+        elapsed = time.perf_counter() - started
+
+    await router.stop()
+    await telegram.stop()
+    await graphql.stop()
+
+    caches = [w["graphql"]["cache"] for w in health["workers"] if w]
+    return (
+        workers,
+        f"{len(scenario) / elapsed:.1f}",
+        f"{elapsed:.2f}",
+        sum(count for kind, count in graphql.requests.items() if kind != "error"),
+        sum(c["hits"] for c in caches),
+        sum(c["shared_hits"] for c in caches),
+        sum(count for status, count in statuses.items() if status != 200),
+    )
+
+async def run(args):
+    os.environ.update({
+        "BOT_TOKEN": "123456:LOADTEST",
+        "METRICS_PORT": "0",
+        "WEBHOOK_URL": "",
+        "GRAPHQL_RATE_LIMIT": "0",
+        "CATALOG_ENABLED": "0",
+        "LOG_LEVEL": args.log_level,
+    })
+    import bot
+    logging.getLogger().setLevel(args.log_level)
+
+    # Reuse loadtest's scenario: the catalog and queries only depend on the seed
+    scenario = build_scenario(MockGraphQLServer(catalog_size=args.catalog, seed=args.seed), args,
+                              random.Random(args.seed))
+    rows = []
+    for workers in args.workers:
+        rows.append(await run_once(bot, workers, scenario, args))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of BOT_MODE=sharded per worker count")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--updates", type=int, default=3000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--catalog", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=64, help="concurrent webhook POSTs")
+    parser.add_argument("--search-weight", type=float, default=0.3)
+    parser.add_argument("--page-weight", type=float, default=0.2)
+    parser.add_argument("--select-weight", type=float, default=0.35)
+    parser.add_argument("--manual-weight", type=float, default=0.15)
+    parser.add_argument("--inline-weight", type=float, default=0.0)
+    parser.add_argument("--bulk-weight", type=float, default=0.03)
+    parser.add_argument("--typo-rate", type=float, default=0.0)
+    parser.add_argument("--graphql-latency", type=float, default=50, help="mean mock GraphQL latency in ms")
+    parser.add_argument("--telegram-latency", type=float, default=10, help="fake Bot API latency in ms")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPU(s)\n")
+    rows = asyncio.run(run(args))
+    print_table(("workers", "updates/s", "seconds", "upstream requests", "cache hits", "shared hits", "non-200"), rows)
+
+if __name__ == "__main__":
+    main()
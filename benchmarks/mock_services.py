@@ -0,0 +1,264 @@
+"""In-process stand-ins for the AniList GraphQL API and the Telegram Bot API
+
+Both are small aiohttp apps bound to 127.0.0.1 so load tests and benchmarks
+run without network access. Point the bot at them with GRAPHQL_API_URLS and
+TELEGRAM_API_BASE_URL / TELEGRAM_API_FILE_URL.
+"""
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+
+from aiohttp import web
+
+from common import WORDS, sample_synopsis
+
+GENRES = ("Action", "Adventure", "Comedy", "Drama", "Fantasy", "Mystery", "Romance", "Sci-Fi", "Slice of Life")
+FORMATS = ("TV", "MOVIE", "OVA", "ONA", "TV_SHORT")
+STATUSES = ("FINISHED", "RELEASING", "NOT_YET_RELEASED")
+
+def make_catalog(size, seed=0):
+    """Deterministic fake AniList catalog: id -> Media dict with every field the bot queries"""
+    rng = random.Random(seed)
+    words = sorted({word.lower() for word in WORDS if len(word) > 3})
+    catalog = {}
+    for anime_id in range(1, size + 1):
+        title = " ".join(rng.choice(words).capitalize() for _ in range(rng.randint(2, 4)))
+        year = rng.randint(1990, 2024)
+        catalog[anime_id] = {
+            "id": anime_id,
+            "format": rng.choice(FORMATS),
+            "title": {"romaji": f"{title} {anime_id}", "english": title if rng.random() < 0.5 else None},
+            "synonyms": [" ".join(reversed(title.split()))] if rng.random() < 0.3 else [],
+            "episodes": rng.randint(1, 64),
+            "status": rng.choice(STATUSES),
+            "startDate": {"year": year, "month": rng.randint(1, 12), "day": rng.randint(1, 28)},
+            "endDate": {"year": year + 1, "month": rng.randint(1, 12), "day": rng.randint(1, 28)},
+            "duration": rng.choice((5, 12, 24, 25, 110)),
+            "averageScore": rng.randint(40, 95),
+            "genres": rng.sample(GENRES, rng.randint(1, 4)),
+            "description": sample_synopsis(rng.choice((400, 800, 1500, 3000)), seed=anime_id)
+                .replace(" (Source: AniList)", "<br><br>(Source: AniList)"),
+            "siteUrl": f"https://anilist.co/anime/{anime_id}",
+        }
+    return catalog
+
+def project(media, query):
+    """Drop top-level fields the query did not ask for, like the real API would"""
+    if media is None:
+        return None
+    return {key: value for key, value in media.items() if key == "id" or key in query}
+
+class MockGraphQLServer:
+    """Answers the bot's search / detail / batch queries from a fake catalog
+
+    Every request sleeps for `latency` seconds (uniformly jittered by
+    +/- `jitter`), and fails with HTTP 500 with probability `error_rate`.
+    Like AniList, a Media (or title alias) that matches nothing makes the
+    response a 404 that still carries the other aliases' data.
+    With `persisted_queries` it also speaks the automatic persisted query
+    protocol; without it, hash-only requests get a 400 like AniList's.
+    """
+
+    def __init__(self, catalog_size=2000, latency=0.05, jitter=0.5, error_rate=0.0, seed=0,
+                 persisted_queries=False):
+        self.catalog = make_catalog(catalog_size, seed)
+        self.persisted_queries = persisted_queries
+        self._persisted = {}  # sha256 -> query text
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = Counter()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._runner = None
+        self.url = None
+
+    def titles(self):
+        return [media["title"]["romaji"] for media in self.catalog.values()]
+
+    def _search(self, term):
+        term = (term or "").lower()
+        return [media for media in self.catalog.values() if term in media["title"]["romaji"].lower()]
+
+    def _resolve(self, query, variables):
+        if "ids" in variables:
+            ids = set(variables["ids"])
+            media = [project(m, query) for anime_id, m in self.catalog.items() if anime_id in ids]
+            return "ids", {"Page": {"media": media}}
+
+        if "id" in variables:
+            return "id", {"Media": project(self.catalog.get(variables["id"]), query)}
+
+        if "search" in variables:
+            matches = self._search(variables["search"])
+            page = variables.get("page") or 1
+            per_page = variables.get("perPage") or 10
+            start = (page - 1) * per_page
+            last_page = max(1, -(-len(matches) // per_page))
+            return "search", {"Page": {
+                "pageInfo": {
+                    "total": len(matches),
+                    "currentPage": page,
+                    "lastPage": last_page,
+                    "hasNextPage": page < last_page,
+                },
+                "media": [project(m, query) for m in matches[start:start + per_page]],
+            }}
+
+        if "page" in variables:
+            # Catalog snapshot refresh: every anime, most popular first
+            page = variables["page"]
+            per_page = variables.get("perPage") or 50
+            media = list(self.catalog.values())[(page - 1) * per_page:page * per_page]
+            return "catalog", {"Page": {
+                "pageInfo": {"hasNextPage": page * per_page < len(self.catalog)},
+                "media": [project(m, query) for m in media],
+            }}
+
+        # Aliased title lookups: a0: Media(search: $s0) ...
+        data = {}
+        for name, term in variables.items():
+            matches = self._search(term)
+            data[f"a{name[1:]}"] = project(matches[0], query) if matches else None
+        return "titles", data
+
+    async def handle(self, request):
+        raw = await request.read()
+        self.bytes_received += len(raw)
+        payload = json.loads(raw)
+        query = payload.get("query")
+        variables = payload.get("variables") or {}
+
+        query_hash = ((payload.get("extensions") or {}).get("persistedQuery") or {}).get("sha256Hash")
+        if query is None:
+            if not self.persisted_queries:
+                self.requests["rejected"] += 1
+                return web.json_response({"errors": [{"message": "Must provide query string."}]}, status=400)
+            query = self._persisted.get(query_hash)
+            if query is None:
+                self.requests["persisted_miss"] += 1
+                return web.json_response({"errors": [{
+                    "message": "PersistedQueryNotFound",
+                    "extensions": {"code": "PERSISTED_QUERY_NOT_FOUND"},
+                }]})
+        elif query_hash and self.persisted_queries:
+            self._persisted[query_hash] = query
+
+        delay = self.latency * (1 + self.jitter * (2 * self.rng.random() - 1))
+        await asyncio.sleep(max(0.0, delay))
+
+        if self.rng.random() < self.error_rate:
+            self.requests["error"] += 1
+            return web.json_response({"errors": [{"message": "Internal Server Error", "status": 500}]}, status=500)
+
+        kind, data = self._resolve(query, variables)
+        self.requests[kind] += 1
+        status = 200
+        response = {"data": data}
+        if any(value is None for value in data.values()):
+            self.requests["not_found"] += 1
+            status = 404
+            response["errors"] = [{"message": "Not Found.", "status": 404}]
+        body = json.dumps(response)
+        self.bytes_sent += len(body)
+        return web.Response(text=body, status=status, content_type="application/json")
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        self.url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+class FakeTelegramServer:
+    """Accepts Bot API calls and returns plausible results without sending anything
+
+    sendPhoto fails with a "wrong file identifier" error with probability
+    `photo_error_rate`, so the bot's text fallback gets exercised too.
+    """
+
+    def __init__(self, latency=0.01, photo_error_rate=0.0, seed=0):
+        self.latency = latency
+        self.photo_error_rate = photo_error_rate
+        self.rng = random.Random(seed)
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+        self._runner = None
+        self.base_url = None
+        self.file_url = None
+
+    def _message(self, params, **extra):
+        chat_id = int(params.get("chat_id") or 0)
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+        }
+        message.update(extra)
+        return message
+
+    def _photo(self):
+        file_id = f"photo-{next(self._message_ids)}"
+        return [{"file_id": file_id, "file_unique_id": file_id, "width": 460, "height": 650}]
+
+    def _result(self, method, params):
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bot", "username": "loadtest_bot"}
+        if method == "sendMessage":
+            return self._message(params, text=params.get("text", ""))
+        if method == "sendPhoto":
+            return self._message(params, photo=self._photo(), caption=params.get("caption", ""))
+        if method == "sendMediaGroup":
+            media = json.loads(params.get("media") or "[]")
+            return [self._message(params, photo=self._photo(), caption=item.get("caption", "")) for item in media]
+        if method.startswith("editMessage"):
+            return self._message(params, text=params.get("text", ""))
+        return True
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        await asyncio.sleep(self.latency)
+        self.calls[method] += 1
+
+        if method == "sendPhoto" and self.rng.random() < self.photo_error_rate:
+            self.calls["sendPhoto:failed"] += 1
+            return web.json_response(
+                {"ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier/HTTP URL specified"},
+                status=400,
+            )
+        return web.json_response({"ok": True, "result": self._result(method, params)})
+
+    async def start(self, port=0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        root = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+        self.base_url = f"{root}/bot"
+        self.file_url = f"{root}/file/bot"
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,122 @@
+"""Synthetic Telegram Update payloads, plus a CLI to POST them to a webhook
+
+Start the bot with BOT_MODE=webhook (WEBHOOK_URL unset, so nothing is
+registered with Telegram), then e.g.:
+
+    python benchmarks/updates.py --url http://127.0.0.1:8080/telegram --secret s3cret search "frieren"
+    python benchmarks/updates.py select 154587
+"""
+import argparse
+import itertools
+import json
+import time
+import urllib.request
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+def _chat(user_id):
+    return {"id": user_id, "type": "private", "first_name": f"user{user_id}"}
+
+def message_update(user_id, text):
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+    return {"update_id": next(_update_ids), "message": message}
+
+def callback_update(user_id, data, message_id=None):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id or next(_message_ids),
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "bot"},
+                "text": "🎞 Found results",
+            },
+        },
+    }
+
+def inline_query_update(user_id, query, offset=""):
+    return {
+        "update_id": next(_update_ids),
+        "inline_query": {"id": str(next(_update_ids)), "from": _user(user_id), "query": query, "offset": offset},
+    }
+
+def search_update(user_id, query):
+    return message_update(user_id, query)
+
+def select_update(user_id, anime_id):
+    return callback_update(user_id, f"select_{anime_id}")
+
+def page_update(user_id, page):
+    return callback_update(user_id, f"page_{user_id}_{page}")
+
+def bulk_update(user_id, items):
+    """/bulk with one id or title per line"""
+    return message_update(user_id, "/bulk\n" + "\n".join(str(item) for item in items))
+
+def manual_format_update(user_id, title="Frieren", synopsis="An elf mage outlives her party."):
+    return message_update(user_id, f"""{title}
+
+‣ Genres : Adventure, Drama
+‣ Type : TV
+‣ Average Rating : 91
+‣ Status : FINISHED
+‣ First aired : 2023-9-29
+‣ Last aired : 2024-3-22
+‣ Runtime : 24 minutes
+‣ No of episodes : 28
+
+‣ Synopsis : {synopsis}
+
+(Source: AniList)""")
+
+def post_update(url, update, secret=""):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(update).encode(),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.status, response.read().decode()
+
+def main():
+    parser = argparse.ArgumentParser(description="POST a synthetic Update to a local webhook server")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/telegram")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--user", type=int, default=1001)
+    parser.add_argument("kind", choices=("start", "search", "select", "page", "manual", "inline", "bulk"))
+    parser.add_argument("value", nargs="?", default="")
+    args = parser.parse_args()
+
+    builders = {
+        "start": lambda: message_update(args.user, "/start"),
+        "search": lambda: search_update(args.user, args.value or "frieren"),
+        "select": lambda: select_update(args.user, int(args.value or 154587)),
+        "page": lambda: page_update(args.user, int(args.value or 2)),
+        "manual": lambda: manual_format_update(args.user),
+        "inline": lambda: inline_query_update(args.user, args.value or "frieren"),
+        "bulk": lambda: bulk_update(args.user, (args.value or "frieren, 154587").split(",")),
+    }
+    status, body = post_update(args.url, builders[args.kind](), args.secret)
+    print(status, body)
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,610 @@
+import asyncio
+import bisect
+import gzip
+import hashlib
+import heapq
+import hmac
 import logging
+import multiprocessing
 import re
 import os
-import requests
 import json
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
+import random
+import signal
+import sqlite3
+import threading
+import time
+import unicodedata
+import aiohttp
+from aiohttp import web
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from telegram import (
+    Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputTextMessageContent,
+    InlineQueryResultArticle, InlineQueryResultCachedPhoto, InlineQueryResultPhoto
+)
+from telegram.error import BadRequest, TelegramError
+from telegram.request import HTTPXRequest
+from telegram.ext import (
+    Application, BaseUpdateProcessor, CommandHandler, MessageHandler, CallbackQueryHandler, InlineQueryHandler,
+    filters, ContextTypes
+)
+
+try:
+    import redis.asyncio as redis_asyncio
+except ImportError:  # Optional, only needed for SESSION_BACKEND=redis
+    redis_asyncio = None
+
+try:
+    import orjson
+except ImportError:  # Optional, faster JSON for GraphQL traffic
+    orjson = None
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "7859842889:AAFSn3HZFBRe48MR9LnndoVrX4WCQeo2Ulg")
 
+# "polling" (default), "webhook" or "sharded"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+
+# Webhook mode: WEBHOOK_URL is the public https URL Telegram posts to
+# (left empty, the webhook is not registered, e.g. for local testing)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+
+# BOT_MODE=sharded: the webhook ingress forwards each update over a unix
+# socket to one of SHARD_WORKERS processes, picked by user id, so a user's
+# updates stay in order on one worker. Workers share GraphQL responses
+# through SHARED_CACHE_PATH and keep sessions in SQLite.
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+SHARD_SOCKET_DIR = os.getenv("SHARD_SOCKET_DIR", "/tmp/animebot-shards")
+SHARD_START_TIMEOUT = float(os.getenv("SHARD_START_TIMEOUT", "60"))
+# Workers that keep exiting are restarted after a delay doubling from
+# SHARD_RESTART_DELAY up to SHARD_RESTART_MAX_DELAY; one that outlived
+# SHARD_START_TIMEOUT starts over at the base delay
+SHARD_RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "1"))
+SHARD_RESTART_MAX_DELAY = float(os.getenv("SHARD_RESTART_MAX_DELAY", "300"))
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "data/cache.sqlite3")
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "50000"))
+
+# Bot API server; point at a local stand-in for offline load tests
+TELEGRAM_API_BASE_URL = os.getenv("TELEGRAM_API_BASE_URL", "https://api.telegram.org/bot")
+TELEGRAM_API_FILE_URL = os.getenv("TELEGRAM_API_FILE_URL", "https://api.telegram.org/file/bot")
+
+# Keep updates that arrived while the bot was down
+DROP_PENDING_UPDATES = os.getenv("DROP_PENDING_UPDATES", "0") == "1"
+
 # Restored your original API URL
 GRAPHQL_API_URL = "https://animmes2uapi.vercel.app/api/graphql"
 
+# Endpoints tried in priority order; AniList's own API is the fallback
+GRAPHQL_API_URLS = [
+    url.strip()
+    for url in os.getenv("GRAPHQL_API_URLS", f"{GRAPHQL_API_URL},https://graphql.anilist.co").split(",")
+    if url.strip()
+]
+
 # Restored your original AniList CDN
 ANILIST_IMG_CDN = "https://img.anili.st"
 
+# Shared HTTP client tuning for the GraphQL API
+GRAPHQL_TIMEOUT = float(os.getenv("GRAPHQL_TIMEOUT", "15"))
+GRAPHQL_POOL_SIZE = int(os.getenv("GRAPHQL_POOL_SIZE", "20"))
+GRAPHQL_KEEPALIVE = float(os.getenv("GRAPHQL_KEEPALIVE", "30"))
+GRAPHQL_MAX_INFLIGHT = int(os.getenv("GRAPHQL_MAX_INFLIGHT", "16"))  # whole bot; split across shard workers
+
+# Automatic persisted queries: send only the query's sha256 and fall back to
+# the full text when an endpoint doesn't know (or support) it
+GRAPHQL_PERSISTED_QUERIES = os.getenv("GRAPHQL_PERSISTED_QUERIES", "0") == "1"
+
+# Bulk post generation (/bulk)
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50"))
+BULK_ID_CHUNK = 50  # API's per-page limit for id_in lookups
+BULK_TITLE_CHUNK = int(os.getenv("BULK_TITLE_CHUNK", "10"))
+MEDIA_GROUP_LIMIT = 10
+
+# Formatting of /bulk results and multi-entry manual dumps: "thread",
+# "process" or "inline"; batches below FORMAT_OFFLOAD_MIN always run inline
+FORMAT_EXECUTOR = os.getenv("FORMAT_EXECUTOR", "thread").lower()
+FORMAT_WORKERS = int(os.getenv("FORMAT_WORKERS", str(min(4, os.cpu_count() or 1))))
+FORMAT_MAX_PENDING = int(os.getenv("FORMAT_MAX_PENDING", "32"))
+FORMAT_OFFLOAD_MIN = int(os.getenv("FORMAT_OFFLOAD_MIN", "4"))
+MANUAL_MAX_ENTRIES = int(os.getenv("MANUAL_MAX_ENTRIES", "20"))
+
+# Outbound GraphQL protection: token bucket + per-endpoint circuit breakers.
+# Rate and burst are for the whole bot: in BOT_MODE=sharded each worker
+# gets an equal share of them (and of GRAPHQL_MAX_INFLIGHT). Breakers are
+# per process, so each worker trips on the failures it sees itself.
+GRAPHQL_RATE_LIMIT = float(os.getenv("GRAPHQL_RATE_LIMIT", "10"))  # requests per second
+GRAPHQL_RATE_BURST = int(os.getenv("GRAPHQL_RATE_BURST", "20"))
+GRAPHQL_RATE_MAX_WAIT = float(os.getenv("GRAPHQL_RATE_MAX_WAIT", "2"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+# Retries, hedging and endpoint selection (all queries we send are idempotent reads)
+GRAPHQL_RETRIES = int(os.getenv("GRAPHQL_RETRIES", "2"))
+GRAPHQL_BACKOFF_BASE = float(os.getenv("GRAPHQL_BACKOFF_BASE", "0.2"))
+GRAPHQL_BACKOFF_MAX = float(os.getenv("GRAPHQL_BACKOFF_MAX", "2"))
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "1") == "1"
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+ENDPOINT_SLOW_FACTOR = float(os.getenv("ENDPOINT_SLOW_FACTOR", "3"))
+ENDPOINT_REPROBE_INTERVAL = float(os.getenv("ENDPOINT_REPROBE_INTERVAL", "60"))
+
+# Updates handled at once across all users (each user's stay in order)
+MAX_CONCURRENT_UPDATES = int(os.getenv("MAX_CONCURRENT_UPDATES", "64"))
+
+# In-process cache for GraphQL responses
+CACHE_TTL = float(os.getenv("CACHE_TTL", "900"))
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Finished (caption, cover_url) posts, keyed by anime id, a digest of the
+# source record and the template version
+RENDER_CACHE_TTL = float(os.getenv("RENDER_CACHE_TTL", str(24 * 3600)))
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES", "4096"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# How long to trust a cover's known availability on the CDN
+COVER_AVAILABLE_TTL = float(os.getenv("COVER_AVAILABLE_TTL", str(7 * 24 * 3600)))
+COVER_MISSING_TTL = float(os.getenv("COVER_MISSING_TTL", "3600"))
+COVER_CACHE_MAX_ENTRIES = int(os.getenv("COVER_CACHE_MAX_ENTRIES", "20000"))
+
+# Search session storage: "memory", "sqlite" or "redis"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_TTL = float(os.getenv("SESSION_TTL", "1800"))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "50000"))
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "data/sessions.sqlite3")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+
+# Background prefetch of neighbouring search pages
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_PREVIOUS = os.getenv("PREFETCH_PREVIOUS", "0") == "1"
+PREFETCH_MAX_CONCURRENT = int(os.getenv("PREFETCH_MAX_CONCURRENT", "4"))
+
+# Optional local snapshot of the most popular anime, answering searches
+# without a round-trip; misses still go to the live API
+CATALOG_ENABLED = os.getenv("CATALOG_ENABLED", "0") == "1"
+CATALOG_PATH = os.getenv("CATALOG_PATH", "data/catalog.json.gz")
+CATALOG_MAX_ENTRIES = int(os.getenv("CATALOG_MAX_ENTRIES", "5000"))
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", str(24 * 3600)))
+
+# Typo-tolerant search over catalog titles and titles seen in API results:
+# confident matches rewrite the query before it goes upstream, weaker ones
+# are offered as "Did you mean" buttons when the API finds nothing
+FUZZY_ENABLED = os.getenv("FUZZY_ENABLED", "1") == "1"
+FUZZY_CORRECT_SCORE = float(os.getenv("FUZZY_CORRECT_SCORE", "0.6"))
+FUZZY_SUGGEST_SCORE = float(os.getenv("FUZZY_SUGGEST_SCORE", "0.35"))
+FUZZY_WORD_SCORE = float(os.getenv("FUZZY_WORD_SCORE", "0.3"))  # per query word, for rewrites
+FUZZY_MAX_TITLES = int(os.getenv("FUZZY_MAX_TITLES", "20000"))
+
+# Inline mode (@bot title): keystrokes within INLINE_DEBOUNCE of each other
+# only look up the last one; answers are cached here and by Telegram
+INLINE_MIN_QUERY = int(os.getenv("INLINE_MIN_QUERY", "3"))
+INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.25"))
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "300"))  # seconds Telegram may reuse an answer
+INLINE_CACHE_TTL = float(os.getenv("INLINE_CACHE_TTL", "600"))
+INLINE_CACHE_MAX_ENTRIES = int(os.getenv("INLINE_CACHE_MAX_ENTRIES", "4096"))
+
+# Where uploaded cover file_ids are persisted (empty keeps them in memory only)
+COVER_DB_PATH = os.getenv("COVER_DB_PATH", "data/covers.sqlite3")
+
+# Prometheus-style /metrics endpoint (port 0 disables it)
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9090"))
+
+# Connections kept open to the Telegram Bot API
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", "256"))
+
+# Also applies to sharded worker processes
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+    level=LOG_LEVEL
 )
 logger = logging.getLogger(__name__)
 
-class AnimeFormatter:
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15)
+CPU_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    type = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        for key, series in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series):
+                yield f"{self.name}_bucket", labels + [("le", repr(float(bound)))], count
+            yield f"{self.name}_bucket", labels + [("le", "+Inf")], series[-1]
+            yield f"{self.name}_sum", labels, series[-2]
+            yield f"{self.name}_count", labels, series[-1]
+
+class CallbackMetric:
+    """Gauge or counter read from application state at scrape time
+
+    `read` returns a number, or a dict of label-value tuples to numbers,
+    and may be a coroutine function.
+    """
+
+    def __init__(self, name, help_text, read, labelnames=(), type="gauge"):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.labelnames = labelnames
+        self.type = type
+
+    async def collect(self):
+        values = self.read()
+        if asyncio.iscoroutine(values):
+            values = await values
+        if not isinstance(values, dict):
+            values = {(): values}
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in values.items()]
+
+class MetricsRegistry:
+    """Holds every metric and renders them in the Prometheus text format"""
+
     def __init__(self):
-        self.input_pattern = re.compile(
-            r'(?P<title>.*?)\s*\n\s*\n?'
-            r'[‣•]\s*Genres\s*:\s*(?P<genres>.*?)\s*\n'
-            r'[‣•]\s*Type\s*:\s*(?P<type>.*?)\s*\n'
-            r'[‣•]\s*Average Rating\s*:\s*(?P<rating>.*?)\s*\n'
-            r'[‣•]\s*Status\s*:\s*(?P<status>.*?)\s*\n'
-            r'[‣•]\s*First aired\s*:\s*(?P<first_aired>.*?)\s*\n'
-            r'[‣•]\s*Last aired\s*:\s*(?P<last_aired>.*?)\s*\n'
-            r'[‣•]\s*Runtime\s*:\s*(?P<runtime>.*?)\s*\n'
-            r'[‣•]\s*No of episodes\s*:\s*(?P<episodes>.*?)\s*\n\s*\n?'
-            r'[‣•]\s*Synopsis\s*:\s*(?P<synopsis>.*)',
-            re.DOTALL | re.IGNORECASE
+        self._metrics = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name, help_text, read, labelnames=(), type="gauge"):
+        return self._register(CallbackMetric(name, help_text, read, labelnames, type))
+
+    async def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = await metric.collect() if isinstance(metric, CallbackMetric) else list(metric.samples())
+            except Exception as e:
+                logger.warning(f"Could not collect metric {metric.name}: {str(e)}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in samples:
+                value = int(value) if isinstance(value, bool) else value
+                text = str(value) if isinstance(value, int) else repr(float(value))
+                lines.append(f"{name}{_format_labels(labels)} {text}")
+        return "\n".join(lines) + "\n"
+
+METRICS = MetricsRegistry()
+
+GRAPHQL_REQUEST_SECONDS = METRICS.histogram(
+    "animebot_graphql_request_seconds", "GraphQL call latency per operation, retries included", ("operation",)
+)
+GRAPHQL_REQUESTS = METRICS.counter(
+    "animebot_graphql_requests_total", "GraphQL calls per operation and outcome", ("operation", "outcome")
+)
+GRAPHQL_UPSTREAM_SECONDS = METRICS.histogram(
+    "animebot_graphql_upstream_seconds", "Latency of single POSTs per endpoint", ("endpoint", "outcome")
+)
+FORMATTER_SECONDS = METRICS.histogram(
+    "animebot_formatter_seconds", "Time spent parsing and rendering posts", ("stage",), buckets=CPU_BUCKETS
+)
+TELEGRAM_REQUEST_SECONDS = METRICS.histogram(
+    "animebot_telegram_request_seconds", "Telegram Bot API call latency per method", ("method",)
+)
+UPDATE_QUEUE_SECONDS = METRICS.histogram(
+    "animebot_update_queue_seconds", "Time an update waited before its handler started"
+)
+UPDATE_HANDLER_SECONDS = METRICS.histogram(
+    "animebot_update_handler_seconds", "Time spent running handlers for one update"
+)
+
+class InstrumentedRequest(HTTPXRequest):
+    """HTTPXRequest that records latency per Bot API method (sendPhoto, sendMessage, ...)"""
+
+    async def do_request(self, url, method, *args, **kwargs):
+        with TELEGRAM_REQUEST_SECONDS.time(method=url.rsplit("/", 1)[-1]):
+            return await super().do_request(url, method, *args, **kwargs)
+
+class MetricsServer:
+    """Serves the registry on a local /metrics endpoint"""
+
+    def __init__(self, registry=METRICS, listen=METRICS_LISTEN, port=METRICS_PORT):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self.web_app = web.Application()
+        self.web_app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = None
+
+    async def handle_metrics(self, request):
+        body = await self.registry.render()
+        return web.Response(text=body, content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Metrics available at http://{self.listen}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+# Small caps mapping - RESTORED YOUR ORIGINAL
+SMALL_CAPS_TABLE = str.maketrans(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    "ᴀʙᴄᴅᴇғɢʜɪᴊᴋʟᴍɴᴏᴘǫʀsᴛᴜᴠᴡxʏᴢ" * 2
+)
+
+# Patterns used on every post, compiled once
+DIGITS_PATTERN = re.compile(r'\d+')
+SOURCE_PATTERN = re.compile(r'\(Source:.*?\)', re.IGNORECASE | re.DOTALL)
+HTML_TAG_PATTERN = re.compile(r'<.*?>')
+MANUAL_SOURCE_LINE_PATTERN = re.compile(r'\s*\(Source:.*\)\s*$', re.IGNORECASE)
+FIELD_LABEL_LINE_PATTERN = re.compile(r'^\s*[‣•]\s*\w[^:\n]*:', re.MULTILINE)
+
+# Post layout - exact style requested
+POST_DIVIDER = "────────────────────────"
+POST_RELEASE_BLOCK = """<b>➤ Season :</b> <code>1</code>
+<b>➢ Audio :</b> <code>Jap • Eng • Hin • Tel • Tam</code>
+<b>➤ Quality :</b><code> 480ᴘ • 720ᴘ • 1080ᴘ</code>"""
+POST_FOOTER = "💠 <b>Powered By</b> : @OtakusFlix"
+POST_TEMPLATE = """<b>{title}</b>
+{divider}
+{release_block}
+<b>➥ Episodes :</b> {episodes}
+<blockquote expandable><b>➟ sʏɴᴏᴘsɪs :</b> <i>{synopsis}</i></blockquote>
+{divider}
+{footer}"""
+
+# Changes whenever the layout above (or the cover CDN) does, so rendered
+# posts cached under an older version are never served again
+TEMPLATE_VERSION = hashlib.sha256(
+    "\0".join((POST_TEMPLATE, POST_DIVIDER, POST_RELEASE_BLOCK, POST_FOOTER, ANILIST_IMG_CDN)).encode()
+).hexdigest()[:12]
+
+# Media fields that reach a rendered post (the rest of AnimeRecord is unused there)
+MEDIA_RENDER_FIELDS = ("id", "title", "episodes", "description")
+
+def format_date(date_dict):
+    """Format date from API response"""
+    if not date_dict or not date_dict.get("year"):
+        return "Unknown"
+
+    year = date_dict["year"]
+    month = date_dict.get("month") or 1
+    day = date_dict.get("day") or 1
+
+    return f"{year}-{month:02d}-{day:02d}"
+
+@dataclass(slots=True)
+class AnimeRecord:
+    """Anime details as shown in a post, from a manual message or the API"""
+    title: str
+    genres: str = ""
+    type: str = ""
+    rating: str = ""
+    status: str = ""
+    first_aired: str = ""
+    last_aired: str = ""
+    runtime: str = ""
+    episodes: str = ""
+    synopsis: str = ""
+    anime_id: int | None = None
+
+    @classmethod
+    def from_media(cls, media):
+        """Build a record straight from an API Media object"""
+        title = media.get("title") or {}
+        description = media.get("description") or "No synopsis available."
+        description = AnimeFormatter.strip_html_tags(description)
+        description = description.replace('\n', ' ').strip()
+
+        return cls(
+            title=(title.get("english") or title.get("romaji") or "").strip(),
+            genres=', '.join(media.get('genres') or ['Sample']),
+            type=str(media.get('format') or 'TV'),
+            rating=str(media.get('averageScore') or '100'),
+            status=(media.get('status') or 'Unknown').replace('_', ' '),
+            first_aired=format_date(media.get('startDate')),
+            last_aired=format_date(media.get('endDate')),
+            runtime=f"{media.get('duration') or '24'} min",
+            episodes=str(media["episodes"]) if media.get("episodes") else "—",
+            synopsis=description,
+            anime_id=media.get("id")
         )
 
+# Manual-format field labels (casefolded, single-spaced) -> AnimeRecord field
+MANUAL_FIELD_LABELS = {
+    "genres": "genres",
+    "type": "type",
+    "average rating": "rating",
+    "status": "status",
+    "first aired": "first_aired",
+    "last aired": "last_aired",
+    "runtime": "runtime",
+    "no of episodes": "episodes",
+    "synopsis": "synopsis",
+}
+REQUIRED_MANUAL_FIELDS = {"title": "Anime title", "synopsis": "‣ Synopsis"}
+FIELD_BULLETS = "‣•"
+
+# Any line opening a known field, with either bullet; routes messages to the manual formatter
+MANUAL_FIELD_LINE_PATTERN = re.compile(
+    r'^\s*[' + FIELD_BULLETS + r']\s*(?:'
+    + '|'.join(r'\s+'.join(map(re.escape, label.split())) for label in MANUAL_FIELD_LABELS)
+    + r')\s*:',
+    re.IGNORECASE | re.MULTILINE
+)
+
+class AnimeParseError(ValueError):
+    """A manual-format message is missing required fields"""
+
+    def __init__(self, missing_fields):
+        self.missing_fields = missing_fields
+        super().__init__(f"Missing fields: {', '.join(missing_fields)}")
+
+class AnimeFormatter:
+    def parse_anime_record(self, text):
+        """Parse a manual-format message line by line, in linear time
+
+        Fields may appear in any order and all but the title and synopsis
+        are optional. Everything after the synopsis label belongs to the
+        synopsis. Raises AnimeParseError naming the missing fields.
+        """
+        with FORMATTER_SECONDS.time(stage="parse"):
+            title_lines = []
+            values = {}
+            current = None
+
+            for line in text.strip().splitlines():
+                if current == "synopsis":
+                    values["synopsis"].append(line)
+                    continue
+
+                stripped = line.strip()
+                field = None
+                labelled = False
+                if stripped and stripped[0] in FIELD_BULLETS:
+                    label, colon, value = stripped[1:].partition(":")
+                    if colon:
+                        labelled = True
+                        field = MANUAL_FIELD_LABELS.get(" ".join(label.casefold().split()))
+
+                if field is not None:
+                    current = field
+                    values[field] = [value.strip()]
+                elif labelled:
+                    # Unknown label ("‣ Studios : ..."): ends the current field and is dropped
+                    # along with its wrapped lines
+                    if current is not None:
+                        current = ""
+                elif current is not None:
+                    # Wrapped continuation of the previous field
+                    if stripped and current:
+                        values[current].append(stripped)
+                else:
+                    title_lines.append(line)
+
+            data = {field: " ".join(v for v in parts if v).strip() for field, parts in values.items() if field != "synopsis"}
+            if "synopsis" in values:
+                data["synopsis"] = "\n".join(values["synopsis"]).strip()
+            data["title"] = "\n".join(title_lines).strip()
+
+            missing = [label for field, label in REQUIRED_MANUAL_FIELDS.items() if not data.get(field)]
+            if missing:
+                raise AnimeParseError(missing)
+
+            return AnimeRecord(**data)
+
+    @staticmethod
+    def split_manual_entries(text):
+        """Split a multi-anime dump into entries, each ending at its "(Source: ...)" line"""
+        entries = []
+        current = []
+        for line in text.splitlines():
+            current.append(line)
+            if MANUAL_SOURCE_LINE_PATTERN.match(line):
+                entries.append("\n".join(current).strip())
+                current = []
+        rest = "\n".join(current).strip()
+        if rest:
+            if entries and FIELD_LABEL_LINE_PATTERN.search(rest) is None:
+                entries[-1] += "\n" + rest  # trailing text, not a new entry
+            else:
+                entries.append(rest)
+        return [entry for entry in entries if entry]
+
     def parse_anime_info(self, text):
-        text = text.strip()
-        match = self.input_pattern.search(text)
-        if not match:
+        try:
+            return self.parse_anime_record(text)
+        except AnimeParseError:
             return None
-
-        data = {k: (v.strip() if v else "") for k, v in match.groupdict().items()}
-        return data
     
     def extract_episode_count(self, episodes_text):
         """Extract episode count from text, handling various formats"""
         if not episodes_text:
             return "—"
         
-        # Try to find numbers in the text
-        numbers = re.findall(r'\d+', episodes_text)
+        # Use the last number found (most likely the episode count);
+        # "Ongoing", "Airing", "TBA" and the like have none
+        numbers = DIGITS_PATTERN.findall(episodes_text)
         if numbers:
-            # Use the last number found (most likely the episode count)
             return numbers[-1]
         
-        # Check for common patterns
-        if re.search(r'\b(ongoing|airing|tba)\b', episodes_text, re.IGNORECASE):
-            return "—"
-        
         return "—"
     
     def convert_to_small_caps(self, text):
@@ -67,28 +612,12 @@ class AnimeFormatter:
         if not text:
             return ""
         
-        # Small caps mapping - RESTORED YOUR ORIGINAL
-        small_caps_map = {
-            'a': 'ᴀ', 'b': 'ʙ', 'c': 'ᴄ', 'd': 'ᴅ', 'e': 'ᴇ', 'f': 'ғ',
-            'g': 'ɢ', 'h': 'ʜ', 'i': 'ɪ', 'j': 'ᴊ', 'k': 'ᴋ', 'l': 'ʟ',
-            'm': 'ᴍ', 'n': 'ɴ', 'o': 'ᴏ', 'p': 'ᴘ', 'q': 'ǫ', 'r': 'ʀ',
-            's': 's', 't': 'ᴛ', 'u': 'ᴜ', 'v': 'ᴠ', 'w': 'ᴡ', 'x': 'x',
-            'y': 'ʏ', 'z': 'ᴢ',
-            'A': 'ᴀ', 'B': 'ʙ', 'C': 'ᴄ', 'D': 'ᴅ', 'E': 'ᴇ', 'F': 'ғ',
-            'G': 'ɢ', 'H': 'ʜ', 'I': 'ɪ', 'J': 'ᴊ', 'K': 'ᴋ', 'L': 'ʟ',
-            'M': 'ᴍ', 'N': 'ɴ', 'O': 'ᴏ', 'P': 'ᴘ', 'Q': 'ǫ', 'R': 'ʀ',
-            'S': 's', 'T': 'ᴛ', 'U': 'ᴜ', 'V': 'ᴠ', 'W': 'ᴡ', 'X': 'x',
-            'Y': 'ʏ', 'Z': 'ᴢ'
-        }
-        
-        result = []
-        for char in text:
-            if char in small_caps_map:
-                result.append(small_caps_map[char])
-            else:
-                result.append(char)
-        
-        return ''.join(result)
+        return text.translate(SMALL_CAPS_TABLE)
+
+    @staticmethod
+    def strip_html_tags(text):
+        """Remove HTML tags from API descriptions"""
+        return HTML_TAG_PATTERN.sub('', text)
 
     def truncate_synopsis(self, synopsis, max_chars=500):
         """Truncate synopsis to fit in blockquote"""
@@ -96,7 +625,7 @@ class AnimeFormatter:
             return ""
         
         # Clean source references
-        synopsis = re.sub(r'\(Source:.*?\)', '', synopsis, flags=re.IGNORECASE | re.DOTALL).strip()
+        synopsis = SOURCE_PATTERN.sub('', synopsis).strip()
         
         # Truncate if too long
         if len(synopsis) > max_chars:
@@ -105,21 +634,22 @@ class AnimeFormatter:
         # Convert to small caps - RESTORED iltac CONVERSION
         return self.convert_to_small_caps(synopsis)
 
-    def format_html(self, data, cover_url=None, anime_id=None):
-        title = data.get('title', 'Unknown Title')
-        synopsis = self.truncate_synopsis(data.get('synopsis', ''))
-        episodes = self.extract_episode_count(data.get('episodes', ''))
-        
-        # Format with exact style requested
-        formatted_output = f"""<b>{title}</b>
-────────────────────────
-<b>➤ Season :</b> <code>1</code>
-<b>➢ Audio :</b> <code>Jap • Eng • Hin • Tel • Tam</code>
-<b>➤ Quality :</b><code> 480ᴘ • 720ᴘ • 1080ᴘ</code>
-<b>➥ Episodes :</b> {episodes}
-<blockquote expandable><b>➟ sʏɴᴏᴘsɪs :</b> <i>{synopsis}</i></blockquote>
-────────────────────────
-💠 <b>Powered By</b> : @OtakusFlix"""
+    def format_html(self, record, cover_url=None, anime_id=None):
+        with FORMATTER_SECONDS.time(stage="format"):
+            title = record.title
+            synopsis = self.truncate_synopsis(record.synopsis)
+            episodes = self.extract_episode_count(record.episodes)
+            anime_id = anime_id or record.anime_id
+
+            # Format with exact style requested
+            formatted_output = POST_TEMPLATE.format(
+                title=title,
+                divider=POST_DIVIDER,
+                release_block=POST_RELEASE_BLOCK,
+                episodes=episodes,
+                synopsis=synopsis,
+                footer=POST_FOOTER,
+            )
         
         # RESTORED YOUR ORIGINAL COVER URL GENERATION
         if not cover_url and anime_id:
@@ -127,162 +657,2172 @@ class AnimeFormatter:
         
         return formatted_output, cover_url
 
-class AnimeSearch:
-    def __init__(self):
-        self.api_url = GRAPHQL_API_URL
+# Formatter used by render_* in executor workers (one per process)
+_render_formatter = AnimeFormatter()
+
+def render_media(media):
+    """(caption, cover_url) for an API Media object"""
+    return _render_formatter.format_html(AnimeRecord.from_media(media), anime_id=media.get("id"))
+
+def render_cache_key(media, anime_id=None):
+    """Render-cache key: anime id, a digest of the fields the post is built from, template version"""
+    source = json_dumps([media.get(field) for field in MEDIA_RENDER_FIELDS])
+    digest = hashlib.blake2b(source.encode(), digest_size=12).hexdigest()
+    return anime_id or media.get("id"), digest, TEMPLATE_VERSION
+
+def render_manual(text):
+    """(caption, None) for one manual-format entry, or (None, missing field names)
+
+    Errors come back as values so nothing custom has to be pickled
+    between processes.
+    """
+    try:
+        record = _render_formatter.parse_anime_record(text)
+    except AnimeParseError as e:
+        return None, e.missing_fields
+    return _render_formatter.format_html(record)[0], None
+
+def render_batch(render, items):
+    return [render(item) for item in items]
+
+class FormattingPool:
+    """Runs formatting off the event loop in order-preserving batches
+
+    Batches smaller than `offload_min` are rendered inline, where the
+    executor hand-off would cost more than it saves. Larger ones are split
+    into one chunk per worker; at most `max_pending` chunks are queued at
+    once and further callers wait for a free slot. In "process" mode the
+    formatter stage timings are recorded in the workers, not exported.
+    """
+
+    def __init__(self, mode=FORMAT_EXECUTOR, workers=FORMAT_WORKERS, max_pending=FORMAT_MAX_PENDING,
+                 offload_min=FORMAT_OFFLOAD_MIN):
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.offload_min = offload_min
+        self._slots = asyncio.Semaphore(max_pending)
+        self._executor = None
+        self.pending = 0
+        self.offloaded = 0
+        self.inline = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="formatter")
+        elif self.mode == "process":
+            # spawn, not fork: the parent has threads (sqlite, executors) by now
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        if self._executor is not None:
+            logger.info(f"Formatting pool started ({self.mode}, {self.workers} workers)")
+
+    async def map(self, render, items):
+        """[render(item) for item in items], in parallel for big batches"""
+        items = list(items)
+        if self._executor is None or len(items) < self.offload_min:
+            self.inline += len(items)
+            return [render(item) for item in items]
+
+        size = -(-len(items) // self.workers)
+        chunks = [items[start:start + size] for start in range(0, len(items), size)]
+        try:
+            results = await asyncio.gather(*(self._submit(render_batch, render, chunk) for chunk in chunks))
+        except BrokenExecutor as e:
+            logger.error(f"Formatting pool broke, formatting inline from now on: {str(e)}")
+            self._executor = None
+            self.inline += len(items)
+            return [render(item) for item in items]
+        self.offloaded += len(items)
+        return [result for chunk in results for result in chunk]
+
+    async def _submit(self, fn, *args):
+        async with self._slots:
+            self.pending += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            finally:
+                self.pending -= 1
+
+    async def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+def json_loads(data):
+    """Decode JSON from bytes (or str), with orjson when it is installed"""
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+def json_dumps(value):
+    return orjson.dumps(value).decode() if orjson is not None else json.dumps(value)
+
+def compact_query(text):
+    """Drop comments and collapse whitespace: the query text is sent in every POST body"""
+    text = re.sub(r'#[^\n]*', '', text)
+    return re.sub(r'\s*([{}():,$])\s*', r'\1', " ".join(text.split()))
+
+# Fields each call site needs: buttons only show the title and format,
+# while a rendered post needs everything
+MEDIA_LIST_FIELDS = "id format title { romaji english }"
+MEDIA_DETAIL_FIELDS = """
+  id
+  format
+  title { romaji english }
+  episodes
+  status
+  startDate { year month day }
+  endDate { year month day }
+  duration
+  averageScore
+  genres
+  description
+  siteUrl
+"""
+
+def _search_query(fields):
+    return f"""
+    query ($search: String, $page: Int, $perPage: Int) {{
+      Page(page: $page, perPage: $perPage) {{
+        pageInfo {{ total currentPage lastPage hasNextPage }}
+        media(search: $search, type: ANIME) {{ {fields} }}
+      }}
+    }}
+    """
+
+# Every static query the bot sends, by name, compacted once at import
+GRAPHQL_QUERIES = {name: compact_query(query) for name, query in {
+    # Search keyboards (DM search, page changes, prefetch)
+    "search_list": _search_query(MEDIA_LIST_FIELDS),
+    # Search results rendered straight into posts (inline mode)
+    "search_detail": _search_query(MEDIA_DETAIL_FIELDS),
+    # A selected anime
+    "media_detail": f"""
+    query ($id: Int) {{
+      Media(id: $id, type: ANIME) {{ {MEDIA_DETAIL_FIELDS} }}
+    }}
+    """,
+    # /bulk id lookups
+    "media_by_ids": f"""
+    query ($ids: [Int], $perPage: Int) {{
+      Page(page: 1, perPage: $perPage) {{
+        media(id_in: $ids, type: ANIME) {{ {MEDIA_DETAIL_FIELDS} }}
+      }}
+    }}
+    """,
+    # Local catalog snapshot refresh
+    "catalog_page": f"""
+    query ($page: Int, $perPage: Int) {{
+      Page(page: $page, perPage: $perPage) {{
+        pageInfo {{ hasNextPage }}
+        media(type: ANIME, sort: POPULARITY_DESC) {{ {MEDIA_DETAIL_FIELDS} synonyms }}
+      }}
+    }}
+    """,
+}.items()}
+
+def titles_query(count):
+    """/bulk title lookups: one aliased Media(search:) per title"""
+    declarations = ",".join(f"$s{i}:String" for i in range(count))
+    selections = " ".join(
+        f"a{i}:Media(search:$s{i},type:ANIME){{{compact_query(MEDIA_DETAIL_FIELDS)}}}" for i in range(count)
+    )
+    return f"query({declarations}){{{selections}}}"
+
+
+class ResponseCache:
+    """Bounded TTL + LRU cache for GraphQL results
+
+    With a `shared` store (see SqliteCacheStore), local misses are looked
+    up there and every set() is written through, so processes of a
+    sharded deployment reuse each other's responses.
+    """
+
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES, shared=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.shared_hits = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _estimate_size(value):
+        """Rough memory footprint of a cached value"""
+        try:
+            if orjson is not None:
+                return len(orjson.dumps(value))
+            return len(json.dumps(value, ensure_ascii=False))
+        except (TypeError, ValueError):
+            return 1024
+
+    def __contains__(self, key):
+        """Check for a live entry without touching LRU order or counters"""
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return True
+        return self.shared is not None and self.shared.contains(key)
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        # Expired entries stay until evicted so get_stale() can still serve them
+        if entry is None or entry[0] < time.monotonic():
+            return self._get_shared(key)
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[2]
+
+    def _get_shared(self, key):
+        found = self.shared.get(key) if self.shared is not None else None
+        if found is None:
+            self.misses += 1
+            return None
+
+        value, ttl = found
+        self._store(key, value, ttl)
+        self.hits += 1
+        self.shared_hits += 1
+        return value
+
+    def get_stale(self, key):
+        """Return an entry even if it has expired, for when upstream is unavailable"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self.stale_hits += 1
+        return entry[2]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+        self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl):
+        size = self._estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        expires_at = time.monotonic() + ttl
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def delete(self, key):
+        if key in self._entries:
+            self._remove(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "shared_hits": self.shared_hits,
+            "evictions": self.evictions
+        }
+
+def open_sqlite(path, timeout=5):
+    """Autocommit connection to a local SQLite file in WAL mode, which several processes can share"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=timeout)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
+
+class SqliteStore(ABC):
+    """Base for bounded stores in a SQLite file that several processes write to
+
+    Statements that can wait on another process's write lock run on one
+    background thread with its own connection, in submission order, so
+    lock contention never stalls the event loop. That thread also prunes
+    the store every PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 256
+    READ_TIMEOUT = 0.05  # busy timeout for reads made on the event loop
+
+    def __init__(self, path):
+        self.path = path
+        self._db = open_sqlite(path)  # only used on the background thread once set up
+        self._thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"sqlite-{os.path.basename(path)}")
+        self._writes = 0
+
+    async def _run(self, fn, *args):
+        """Run fn(*args) on the store's thread and wait for it without blocking the loop"""
+        return await asyncio.wrap_future(self._thread.submit(fn, *args))
+
+    def _write(self, statement, params):
+        """Execute one counted write (on the store's thread)"""
+        self._db.execute(statement, params)
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune()
+
+    @abstractmethod
+    def _prune(self):
+        """Drop expired rows and enforce the size cap"""
+
+    def _close(self):
+        self._thread.shutdown(wait=True)  # let queued writes finish
+        self._db.close()
+
+class SqliteCacheStore(SqliteStore):
+    """Second ResponseCache tier in a local SQLite file (WAL), shared across processes
+
+    Keys are stored as JSON text and values as JSON; expiry uses wall-clock
+    time since processes don't share a monotonic clock. ResponseCache is
+    synchronous, so reads run on the loop with a separate connection and a
+    short busy timeout, a locked database counting as a miss; writes are
+    queued to the store's thread without waiting for them.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, max_entries=SHARED_CACHE_MAX_ENTRIES):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self._reader = open_sqlite(path, timeout=self.READ_TIMEOUT)
+        logger.info(f"Shared cache opened at {path}")
+
+    def get(self, key):
+        """(value, seconds left) for a live entry, else None"""
+        try:
+            row = self._reader.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (json_dumps(key),)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.debug(f"Shared cache read failed: {str(e)}")
+            return None
+        if row is None:
+            return None
+        ttl = row[1] - time.time()
+        if ttl <= 0:
+            return None
+        return json_loads(row[0]), ttl
 
-    def _execute_graphql_query(self, query, variables):
-        """Execute GraphQL query to the API"""
+    def contains(self, key):
         try:
-            headers = {
+            row = self._reader.execute(
+                "SELECT 1 FROM cache WHERE key = ? AND expires_at > ?", (json_dumps(key), time.time())
+            ).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def set(self, key, value, ttl):
+        self._thread.submit(
+            self._write_logged,
+            "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (json_dumps(key), json_dumps(value), time.time() + ttl)
+        )
+
+    def delete(self, key):
+        self._thread.submit(self._write_logged, "DELETE FROM cache WHERE key = ?", (json_dumps(key),))
+
+    def _write_logged(self, statement, params):
+        try:
+            self._write(statement, params)
+        except sqlite3.Error as e:
+            # Another process holding the write lock past the timeout only costs a shared miss later
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    def _prune(self):
+        """Drop expired entries, then the ones closest to expiry beyond the cap"""
+        self._db.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        self._db.execute(
+            "DELETE FROM cache WHERE key IN ("
+            "SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def close(self):
+        self._close()
+        self._reader.close()
+
+class TokenBucket:
+    """Token-bucket rate limiter for outbound requests"""
+
+    def __init__(self, rate=GRAPHQL_RATE_LIMIT, burst=GRAPHQL_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.rejected = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """Take a token only if one is available right now"""
+        if self.rate <= 0:
+            return True
+        if self._lock.locked():
+            return False
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def has_spare(self):
+        """True when no one is waiting and at least half the burst is left, without taking a token"""
+        if self.rate <= 0:
+            return True
+        if self._lock.locked():
+            return False
+        self._refill()
+        return self._tokens >= max(1, self.burst / 2)
+
+    async def acquire(self, max_wait=GRAPHQL_RATE_MAX_WAIT):
+        """Take a token, waiting up to max_wait seconds; False if none came in time"""
+        if self.rate <= 0:
+            return True
+
+        # Serialized so waiters get tokens in arrival order
+        async with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                wait = (1 - self._tokens) / self.rate
+                if wait > max_wait:
+                    self.rejected += 1
+                    return False
+                await asyncio.sleep(wait)
+                self._refill()
+            self._tokens -= 1
+            return True
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, probing again after a cool-down"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+            logger.info("Circuit breaker half-open, probing upstream")
+
+        if self.state == self.HALF_OPEN:
+            # Only one probe at a time; everyone else keeps failing fast
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+
+        return True
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info("Circuit breaker closed, upstream recovered")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.times_opened += 1
+                logger.warning(f"Circuit breaker open after {self.failures} failures, failing fast for {self.reset_timeout}s")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+    def release(self):
+        """Give back a half-open probe slot that was allowed but never used"""
+        self._probe_in_flight = False
+
+    def available(self):
+        """Whether allow() could let a call through, without taking the probe slot"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+        return not (self.state == self.HALF_OPEN and self._probe_in_flight)
+
+class GraphQLEndpoint:
+    """One GraphQL URL with its own circuit breaker and latency history"""
+
+    EWMA_ALPHA = 0.2
+
+    def __init__(self, url, priority):
+        self.url = url
+        self.priority = priority
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=200)  # recent successful call times, seconds
+        self.ewma = None
+        self.last_used = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.persisted_queries = None  # APQ support: unknown until the first call
+
+    def record(self, elapsed, ok):
+        self.requests += 1
+        self.last_used = time.monotonic()
+        self.ewma = elapsed if self.ewma is None else self.ewma + self.EWMA_ALPHA * (elapsed - self.ewma)
+        if ok:
+            self.latencies.append(elapsed)
+            self.breaker.record_success()
+        else:
+            self.failures += 1
+            self.breaker.record_failure()
+
+    def record_abandoned(self, elapsed):
+        """A call cancelled because a hedge won still tells us the endpoint is at least this slow"""
+        self.last_used = time.monotonic()
+        self.ewma = elapsed if self.ewma is None else max(self.ewma, self.ewma + self.EWMA_ALPHA * (elapsed - self.ewma))
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def hedge_delay(self):
+        """How long to wait before hedging: this endpoint's p95, once we have enough samples"""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, self.percentile(0.95))
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "breaker_state": self.breaker.state,
+            "breaker_rejected": self.breaker.rejected,
+            "breaker_opened": self.breaker.times_opened,
+            "requests": self.requests,
+            "failures": self.failures,
+            "persisted_queries": self.persisted_queries,
+            "ewma_ms": round(self.ewma * 1000, 1) if self.ewma is not None else None,
+            "p95_ms": round(self.percentile(0.95) * 1000, 1) if self.latencies else None
+        }
+
+class AnimeSearch:
+    def __init__(self, cache=None, catalog=None, processes=1):
+        self.endpoints = [GraphQLEndpoint(url, priority) for priority, url in enumerate(GRAPHQL_API_URLS)]
+        self.cache = cache if cache is not None else ResponseCache()
+        self.catalog = catalog  # optional AnimeCatalog consulted before the API
+        self.titles = FuzzyTitleIndex(FUZZY_MAX_TITLES)  # titles seen in API results
+        self.corrected = 0
+        self._session = None
+        self._inflight = {}  # cache key -> [task shared by concurrent callers, waiters]
+        self.coalesced = 0
+        self.abandoned = 0
+        # The outbound budget is shared by `processes` workers, each taking an equal part
+        self.max_inflight = max(1, GRAPHQL_MAX_INFLIGHT // processes)
+        self._upstream_slots = asyncio.Semaphore(self.max_inflight)
+        self.upstream_active = 0
+        self.upstream_waiting = 0
+        self.rate_limiter = TokenBucket(GRAPHQL_RATE_LIMIT / processes, max(1, GRAPHQL_RATE_BURST // processes))
+        self.stale_served = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @staticmethod
+    def _search_key(query, page, per_page, detail=False):
+        return ("search", " ".join(query.casefold().split()), page, per_page, detail)
+
+    @staticmethod
+    def _media_key(anime_id):
+        return ("media", int(anime_id))
+
+    async def start(self):
+        """Open the shared HTTP session used for every GraphQL call"""
+        if self._session is not None and not self._session.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit=GRAPHQL_POOL_SIZE,
+            limit_per_host=GRAPHQL_POOL_SIZE,
+            keepalive_timeout=GRAPHQL_KEEPALIVE,
+            ttl_dns_cache=300
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=GRAPHQL_TIMEOUT),
+            json_serialize=json_dumps,
+            headers={
                 'Content-Type': 'application/json',
                 'Accept': 'application/json'
             }
-            
-            payload = {
-                "query": query,
-                "variables": variables
-            }
-            
-            response = requests.post(
-                self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=15
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"GraphQL API failed with status {response.status_code}: {response.text}")
+        )
+        logger.info(f"GraphQL client started (pool size {GRAPHQL_POOL_SIZE})")
+
+    async def close(self):
+        """Close the shared HTTP session and release pooled connections"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def upstream_saturated(self):
+        """True when every GraphQL slot is taken or callers are already waiting"""
+        return self.upstream_waiting > 0 or self.upstream_active >= self.max_inflight
+
+    def _ordered_endpoints(self):
+        """Usable endpoints by priority, demoting any much slower than the fastest"""
+        usable = [e for e in self.endpoints if e.breaker.available()]
+
+        # A demoted endpoint gets a fresh chance once it has sat idle for a while
+        now = time.monotonic()
+        for endpoint in usable:
+            if endpoint.ewma is not None and now - endpoint.last_used > ENDPOINT_REPROBE_INTERVAL:
+                endpoint.ewma = None
+
+        known = [e.ewma for e in usable if e.ewma is not None]
+        if not known:
+            return usable
+
+        cutoff = min(known) * ENDPOINT_SLOW_FACTOR
+        fast = [e for e in usable if e.ewma is None or e.ewma <= cutoff]
+        slow = [e for e in usable if e not in fast]
+        return fast + slow
+
+    @staticmethod
+    def _backoff(attempt):
+        """Full-jitter exponential backoff before retry number `attempt`"""
+        return random.uniform(0, min(GRAPHQL_BACKOFF_MAX, GRAPHQL_BACKOFF_BASE * 2 ** attempt))
+
+    async def _execute_graphql_query(self, query, variables, operation="query"):
+        """Execute GraphQL query, recording latency and outcome per operation"""
+        started = time.perf_counter()
+        result = await self._query_with_retries(query, variables)
+        GRAPHQL_REQUEST_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+        if result is None:
+            outcome = "failed"
+        elif result.get("errors"):
+            outcome = "error"
+        else:
+            outcome = "ok"
+        GRAPHQL_REQUESTS.inc(operation=operation, outcome=outcome)
+        return result
+
+    async def _query_with_retries(self, query, variables):
+        """Send a query, retrying across endpoints with jittered backoff"""
+        for attempt in range(GRAPHQL_RETRIES + 1):
+            if attempt:
+                self.retries += 1
+                await asyncio.sleep(self._backoff(attempt))
+
+            endpoints = self._ordered_endpoints()
+            if not endpoints:
+                # Every breaker is open: fail fast so callers can serve stale data
                 return None
+
+            if not await self.rate_limiter.acquire():
+                logger.warning("GraphQL rate limit reached, not sending query")
+                return None
+
+            primary = endpoints[attempt % len(endpoints)]
+            hedge = endpoints[(attempt + 1) % len(endpoints)] if HEDGE_ENABLED and len(endpoints) > 1 else None
+            result = await self._attempt(primary, hedge, query, variables)
+            if result is not None:
+                return result
+
+        return None
+
+    async def _attempt(self, primary, hedge, query, variables):
+        """Call `primary`; if it is slower than its p95, race a second call to `hedge`"""
+        delay = primary.hedge_delay() if hedge is not None else None
+        if delay is None:
+            return await self._call_endpoint(primary, query, variables)
+
+        first = asyncio.create_task(self._call_endpoint(primary, query, variables))
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+        except BaseException:
+            # asyncio.wait() doesn't cancel what it waits on; an abandoned
+            # lookup must not keep its POST, slot and token
+            first.cancel()
+            raise
+        if done or not self.rate_limiter.try_acquire():
+            return await first
+
+        self.hedged += 1
+        second = asyncio.create_task(self._call_endpoint(hedge, query, variables))
+        pending = {first, second}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result is not None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return result
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call_endpoint(self, endpoint, query, variables):
+        """One POST to one endpoint, within the in-flight cap and its breaker"""
+        if not endpoint.breaker.allow():
+            return None
+
+        self.upstream_waiting += 1
+        try:
+            await self._upstream_slots.acquire()
+        except BaseException:
+            endpoint.breaker.release()
+            raise
+        finally:
+            self.upstream_waiting -= 1
+
+        self.upstream_active += 1
+        started = time.monotonic()
+        try:
+            result = await self._post_query(endpoint, query, variables)
+        except BaseException:
+            endpoint.breaker.release()
+            endpoint.record_abandoned(time.monotonic() - started)
+            raise
+        finally:
+            self.upstream_active -= 1
+            self._upstream_slots.release()
+
+        elapsed = time.monotonic() - started
+        endpoint.record(elapsed, ok=result is not None)
+        GRAPHQL_UPSTREAM_SECONDS.observe(elapsed, endpoint=endpoint.url, outcome="ok" if result is not None else "failed")
+        return result
+
+    async def _post_query(self, endpoint, query, variables):
+        """POST a query, as just its hash where the endpoint supports persisted queries"""
+        if not GRAPHQL_PERSISTED_QUERIES or endpoint.persisted_queries is False:
+            return await self._post_graphql(endpoint.url, query, variables)
+
+        extensions = {"persistedQuery": {"version": 1, "sha256Hash": hashlib.sha256(query.encode()).hexdigest()}}
+        result = await self._post_graphql(endpoint.url, None, variables, extensions)
+        if result is None:
+            return None  # transport failure says nothing about APQ; the retry layer handles it
+
+        error = self._persisted_query_error(result)
+        supported = error != "PersistedQueryNotSupported"
+        if endpoint.persisted_queries is not supported:
+            endpoint.persisted_queries = supported
+            logger.info(f"Persisted queries {'supported' if supported else 'not supported'} by {endpoint.url}")
+        if error is None:
+            return result
+
+        # Unknown hash, or no APQ support: sending the text also registers it
+        return await self._post_graphql(endpoint.url, query, variables, extensions)
+
+    @staticmethod
+    def _persisted_query_error(result):
+        """"PersistedQueryNotFound" / "PersistedQueryNotSupported" if the hash alone wasn't enough"""
+        for error in (result or {}).get("errors") or []:
+            text = f"{error.get('message', '')} {(error.get('extensions') or {}).get('code', '')}".lower()
+            if "persistedquerynotfound" in text or "persisted query not found" in text:
+                return "PersistedQueryNotFound"
+            if "persisted" in text or "query string" in text:
+                return "PersistedQueryNotSupported"
+        return None
+
+    def stats(self):
+        return {
+            "cache": self.cache.stats(),
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+            "stale_served": self.stale_served,
+            "upstream_active": self.upstream_active,
+            "upstream_waiting": self.upstream_waiting,
+            "rate_limited": self.rate_limiter.rejected,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "endpoints": [endpoint.stats() for endpoint in self.endpoints],
+            "catalog": self.catalog.stats() if self.catalog is not None else None
+        }
+
+    def _serve_stale(self, cache_key):
+        """Fall back to an expired cache entry when upstream gave nothing"""
+        stale = self.cache.get_stale(cache_key)
+        if stale is not None:
+            self.stale_served += 1
+            logger.info(f"Serving stale cache entry for {cache_key}")
+        return stale
+
+    async def _post_graphql(self, url, query, variables, extensions=None):
+        """Send one GraphQL POST over the shared session"""
+        if self._session is None or self._session.closed:
+            await self.start()
+
+        body = b""
+        try:
+            payload = {"variables": variables}
+            if query is not None:
+                payload["query"] = query
+            if extensions:
+                payload["extensions"] = extensions
             
-            return response.json()
+            async with self._session.post(url, json=payload) as response:
+                # Decode straight from the raw bytes: no charset sniffing or str copy
+                body = await response.read()
+
+                if response.status != 200:
+                    answer = self._graphql_error_answer(response.status, body)
+                    if answer is not None:
+                        return answer
+                    logger.error(f"GraphQL API {url} failed with status {response.status}: {body[:200].decode(errors='replace')}")
+                    return None
+
+            return json_loads(body)
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Network error during GraphQL query: {str(e)}")
+        except asyncio.TimeoutError:
+            logger.error(f"GraphQL query to {url} timed out after {GRAPHQL_TIMEOUT}s")
             return None
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON decode error: {str(e)} - Response: {response.text[:200]}")
+        except aiohttp.ClientError as e:
+            logger.error(f"Network error during GraphQL query to {url}: {str(e)}")
+            return None
+        except ValueError as e:  # json and orjson decode errors are both ValueErrors
+            logger.error(f"JSON decode error: {str(e)} - Response: {body[:200].decode(errors='replace')}")
             return None
         except Exception as e:
             logger.error(f"Unexpected error in GraphQL query: {str(e)}")
             return None
 
-    def search_anime(self, query: str, page: int = 1, per_page: int = 10):
-        """Search anime using GraphQL API"""
-        # USING YOUR ORIGINAL GRAPHQL QUERY
-        graphql_query = """
-        query ($search: String, $page: Int, $perPage: Int) {
-          Page(page: $page, perPage: $perPage) {
-            pageInfo {
-              total
-              currentPage
-              lastPage
-              hasNextPage
-            }
-            media(search: $search, type: ANIME) {
-              id
-              format
-              title {
-                romaji
-                english
-              }
-              episodes
-              status
-              startDate {
-                year
-                month
-                day
-              }
-              endDate {
-                year
-                month
-                day
-              }
-              duration
-              averageScore
-              genres
-              description
-              siteUrl
-              # We only need the ID for cover image URL generation
-            }
-          }
-        }
+    @staticmethod
+    def _graphql_error_answer(status, body):
+        """A 4xx body that is a GraphQL response, else None
+
+        AniList answers a null Media (e.g. one unmatched alias) with a 404
+        carrying both `data` and `errors`: that's a result, not a transport
+        failure to retry or hold against the endpoint. 408/429 still are.
         """
-        
+        if not 400 <= status < 500 or status in (408, 429):
+            return None
+        try:
+            answer = json_loads(body)
+        except ValueError:
+            return None
+        if isinstance(answer, dict) and answer.get("errors"):
+            return answer
+        return None
+
+    def suggest(self, query, limit=5, min_score=FUZZY_SUGGEST_SCORE):
+        """Fuzzy title matches from the catalog and from titles seen so far, best first"""
+        indexes = [self.titles] if self.catalog is None else [self.catalog.fuzzy, self.titles]
+        best = {}
+        for index in indexes:
+            for match in index.search(query, limit, min_score):
+                anime_id = match[3]
+                if anime_id not in best or match[0] > best[anime_id][0]:
+                    best[anime_id] = match
+        return sorted(best.values(), key=lambda m: -m[0])[:limit]
+
+    @staticmethod
+    def _word_in_title(word, title_words):
+        """Whether a query word is (a misspelling of) some title word; numbers must match exactly"""
+        if any(c.isdigit() for c in word):
+            return word in title_words
+        return any(
+            title_word.startswith(word) or trigram_similarity(word, title_word) >= FUZZY_WORD_SCORE
+            for title_word in title_words
+        )
+
+    def correct_query(self, query):
+        """A better-spelled title to search for instead of `query`, or None
+
+        Only rewrites when a known title is about as long as the query and
+        similar to it as a whole (trigram Jaccard), every query word matches
+        one of its words, and the query isn't already a plain word/prefix
+        match for it (no typo to fix). Never rewrites a query that can be
+        answered as typed without a round-trip.
+        """
+        if self.is_search_cached(query, 1):
+            return None
+
+        normalized = normalize_title(query)
+        query_words = normalized.split()
+        best = None
+        for _, display, matched, _ in self.suggest(query):
+            similarity = trigram_similarity(normalized, matched)
+            if similarity < FUZZY_CORRECT_SCORE or (best is not None and similarity <= best[0]):
+                continue
+            # "season 2" or "0" must not be dropped to land on a shorter known title
+            if all(self._word_in_title(word, matched.split()) for word in query_words):
+                best = (similarity, display, matched)
+        if best is None:
+            return None
+
+        _, display, matched = best
+        title_words = matched.split()
+        plain_match = (
+            all(word in title_words for word in query_words[:-1])
+            and any(word.startswith(query_words[-1]) for word in title_words)
+        )
+        if plain_match:
+            return None
+        self.corrected += 1
+        return display
+
+    def is_search_cached(self, query, page, per_page=10):
+        if self.catalog is not None and self.catalog.match(query):
+            return True
+        return self._search_key(query, page, per_page) in self.cache
+
+    async def _singleflight(self, key, fetch, cancel_if_abandoned=False):
+        """Run fetch() once per key, sharing its result with concurrent callers
+
+        With cancel_if_abandoned, a caller that is cancelled while it is
+        the only one waiting also cancels the upstream request.
+        """
+        entry = self._inflight.get(key)  # [task, callers waiting on it]
+        if entry is None:
+            entry = [asyncio.ensure_future(fetch()), 0]
+            self._inflight[key] = entry
+            entry[0].add_done_callback(lambda _: self._forget_inflight(key, entry))
+        else:
+            self.coalesced += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            # Shielded so one caller giving up doesn't cancel the shared request
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if cancel_if_abandoned and entry[1] == 1 and not task.done():
+                self._forget_inflight(key, entry)
+                task.cancel()
+                self.abandoned += 1
+            raise
+        finally:
+            entry[1] -= 1
+
+    def _forget_inflight(self, key, entry):
+        if self._inflight.get(key) is entry:
+            del self._inflight[key]
+
+    async def search_anime(self, query: str, page: int = 1, per_page: int = 10, cancel_if_abandoned=False,
+                           detail=False):
+        """Search anime using GraphQL API
+
+        Results carry only id, title and format unless `detail` asks for
+        every field a rendered post needs.
+        """
+        if self.catalog is not None:
+            result = self.catalog.search_page(query, page, per_page)
+            if result is not None:
+                return result
+
+        cache_key = self._search_key(query, page, per_page, detail)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = await self._singleflight(
+            cache_key,
+            lambda: self._fetch_search_page(query, page, per_page, detail, cache_key),
+            cancel_if_abandoned
+        )
+        return result if result is not None else self._serve_stale(cache_key)
+
+    async def _fetch_search_page(self, query, page, per_page, detail, cache_key):
+        """Fetch one search page from the API and populate the cache"""
         variables = {
             "search": query,
             "page": page,
             "perPage": per_page
         }
-        
-        result = self._execute_graphql_query(graphql_query, variables)
+        graphql_query = GRAPHQL_QUERIES["search_detail" if detail else "search_list"]
+        result = await self._execute_graphql_query(graphql_query, variables, "search_anime")
         
         if not result or "errors" in result:
             logger.error(f"GraphQL query errors: {result.get('errors') if result else 'No result'}")
             return None
             
         if "data" in result and "Page" in result["data"]:
-            return result["data"]["Page"]
+            page_data = result["data"]["Page"]
+            self.cache.set(cache_key, page_data)
+
+            for media in page_data.get("media") or []:
+                if media and media.get("id"):
+                    self.titles.add_media(media)
+                    # Full results can answer a later selection from the cache
+                    if detail:
+                        self.cache.set(self._media_key(media["id"]), media)
+
+            return page_data
         
         return None
 
-    def get_anime_by_id(self, anime_id: int):
+    async def get_anime_by_id(self, anime_id: int):
         """Get anime details by ID using GraphQL API"""
-        # USING YOUR ORIGINAL GRAPHQL QUERY
-        graphql_query = """
-        query ($id: Int) {
-          Media(id: $id, type: ANIME) {
-            id
-            format
-            title {
-              romaji
-              english
-            }
-            episodes
-            status
-            startDate {
-              year
-              month
-              day
-            }
-            endDate {
-              year
-              month
-              day
-            }
-            duration
-            averageScore
-            genres
-            description
-            siteUrl
-            # We only need the ID for cover image URL generation
-          }
-        }
-        """
-        
+        if self.catalog is not None:
+            media = self.catalog.get(anime_id)
+            if media is not None:
+                return media
+
+        cache_key = self._media_key(anime_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        result = await self._singleflight(
+            cache_key,
+            lambda: self._fetch_anime_by_id(anime_id, cache_key)
+        )
+        return result if result is not None else self._serve_stale(cache_key)
+
+    async def _fetch_anime_by_id(self, anime_id, cache_key):
+        """Fetch one Media entry from the API and populate the cache"""
         variables = {"id": anime_id}
-        
-        result = self._execute_graphql_query(graphql_query, variables)
+        result = await self._execute_graphql_query(GRAPHQL_QUERIES["media_detail"], variables, "get_anime_by_id")
         
         if not result or "errors" in result:
             logger.error(f"GraphQL query errors for ID {anime_id}: {result.get('errors') if result else 'No result'}")
             return None
             
         if "data" in result and "Media" in result["data"]:
-            return result["data"]["Media"]
+            media = result["data"]["Media"]
+            if media:
+                self.cache.set(cache_key, media)
+                self.titles.add_media(media)
+            return media
         
         return None
 
+    async def get_anime_batch(self, items):
+        """Look up many ids and/or titles with as few GraphQL requests as possible
+
+        Ids are fetched with Page(media(id_in: ...)) in chunks of the API's
+        per-page limit, titles with aliased Media(search: ...) queries.
+        Returns (item, media or None) pairs in input order.
+        """
+        found = {}
+        missing_ids = []
+        titles = []
+        for item in items:
+            if isinstance(item, int):
+                media = self.catalog.get(item) if self.catalog is not None else None
+                if media is None:
+                    media = self.cache.get(self._media_key(item))
+                if media is not None:
+                    found[item] = media
+                elif item not in missing_ids:
+                    missing_ids.append(item)
+            elif item not in titles:
+                titles.append(item)
+
+        for start in range(0, len(missing_ids), BULK_ID_CHUNK):
+            chunk = missing_ids[start:start + BULK_ID_CHUNK]
+            for media in await self._fetch_ids(chunk):
+                found[media["id"]] = media
+
+        for start in range(0, len(titles), BULK_TITLE_CHUNK):
+            chunk = titles[start:start + BULK_TITLE_CHUNK]
+            found.update(await self._fetch_titles(chunk))
+
+        return [(item, found.get(item)) for item in items]
+
+    async def _fetch_ids(self, anime_ids):
+        result = await self._execute_graphql_query(
+            GRAPHQL_QUERIES["media_by_ids"], {"ids": anime_ids, "perPage": len(anime_ids)}, "get_anime_batch"
+        )
+        if not result or not result.get("data") or not result["data"].get("Page"):
+            logger.error(f"Batch GraphQL query failed for ids {anime_ids}: {result.get('errors') if result else 'No result'}")
+            return []
+
+        media_list = [m for m in result["data"]["Page"].get("media") or [] if m]
+        for media in media_list:
+            self.cache.set(self._media_key(media["id"]), media)
+            self.titles.add_media(media)
+        return media_list
+
+    async def _fetch_titles(self, titles):
+        variables = {f"s{i}": title for i, title in enumerate(titles)}
+        result = await self._execute_graphql_query(titles_query(len(titles)), variables, "get_anime_batch")
+        # A title with no match makes the API report an error next to the
+        # other aliases' data, so only give up when there is no data at all
+        if not result or not result.get("data"):
+            logger.error(f"Batch GraphQL query failed for titles {titles}: {result.get('errors') if result else 'No result'}")
+            return {}
+
+        found = {}
+        for i, title in enumerate(titles):
+            media = result["data"].get(f"a{i}")
+            if media:
+                found[title] = media
+                self.cache.set(self._media_key(media["id"]), media)
+                self.titles.add_media(media)
+        return found
+
+TITLE_SEPARATOR_PATTERN = re.compile(r'[\W_]+')
+
+def normalize_title(text):
+    """Casefold, strip accents/macrons and collapse punctuation to single spaces"""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return TITLE_SEPARATOR_PATTERN.sub(" ", stripped).strip()
+
+def title_trigrams(normalized):
+    """Trigrams of each word padded like pg_trgm ("  w", " wo", "wor", "ord", "rd ")"""
+    trigrams = set()
+    for word in normalized.split():
+        padded = f"  {word} "
+        trigrams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return trigrams
+
+def trigram_similarity(a, b):
+    """Jaccard similarity of two normalized titles' trigrams (shared / union)"""
+    a_trigrams = title_trigrams(a)
+    b_trigrams = title_trigrams(b)
+    if not a_trigrams or not b_trigrams:
+        return 0.0
+    shared = len(a_trigrams & b_trigrams)
+    return shared / (len(a_trigrams) + len(b_trigrams) - shared)
+
+def media_titles(media):
+    """Every name a Media is known by: English, romaji and synonyms"""
+    title = media.get("title") or {}
+    return [name for name in (title.get("english"), title.get("romaji"), *(media.get("synonyms") or [])) if name]
+
+class FuzzyTitleIndex:
+    """Trigram index over normalized titles for typo-tolerant lookups
+
+    A title's score for a query is the share of the query's trigrams it
+    contains, discounted a little when the title is much longer, so
+    "atack on titan" still finds "Attack on Titan" at ~0.9 and a correct
+    substring like "frieren" scores well against "Sousou no Frieren".
+    Extra query words barely lower that score, so it only ranks "Did you
+    mean" suggestions; query rewrites also use trigram_similarity.
+    """
+
+    CANDIDATE_LIMIT = 50  # candidates scored exactly per lookup
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # anime_id -> (display title, normalized titles)
+        self._postings = {}  # trigram -> anime_ids with a title containing it
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, anime_id, names):
+        """Index (or refresh) the titles of one anime"""
+        if not names:
+            return
+        normalized = tuple(dict.fromkeys(n for n in map(normalize_title, names) if n))
+        existing = self._entries.get(anime_id)
+        if existing is not None and existing[1] == normalized:
+            self._entries.move_to_end(anime_id)
+            return
+
+        self.discard(anime_id)
+        self._entries[anime_id] = (names[0], normalized)
+        for trigram in {t for name in normalized for t in title_trigrams(name)}:
+            self._postings.setdefault(trigram, set()).add(anime_id)
+
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            self.discard(next(iter(self._entries)))
+
+    def add_media(self, media):
+        if media and media.get("id"):
+            self.add(media["id"], media_titles(media))
+
+    def discard(self, anime_id):
+        entry = self._entries.pop(anime_id, None)
+        if entry is None:
+            return
+        for trigram in {t for name in entry[1] for t in title_trigrams(name)}:
+            ids = self._postings.get(trigram)
+            if ids is not None:
+                ids.discard(anime_id)
+                if not ids:
+                    del self._postings[trigram]
+
+    @staticmethod
+    def _score(query_trigrams, normalized_title):
+        trigrams = title_trigrams(normalized_title)
+        shared = len(query_trigrams & trigrams)
+        if not shared:
+            return 0.0
+        return shared / len(query_trigrams) * (0.75 + 0.25 * shared / len(trigrams))
+
+    def search(self, query, limit=5, min_score=0.3):
+        """Best (score, display title, matched normalized title, anime_id) tuples, highest first"""
+        query_trigrams = title_trigrams(normalize_title(query))
+        if not query_trigrams:
+            return []
+
+        # A title can't score above the share of query trigrams it contains
+        counts = {}
+        for trigram in query_trigrams:
+            for anime_id in self._postings.get(trigram, ()):
+                counts[anime_id] = counts.get(anime_id, 0) + 1
+        needed = min_score * len(query_trigrams)
+        candidates = heapq.nlargest(
+            self.CANDIDATE_LIMIT, (i for i, c in counts.items() if c >= needed), key=counts.get
+        )
+
+        results = []
+        for anime_id in candidates:
+            display, titles = self._entries[anime_id]
+            score, matched = max((self._score(query_trigrams, title), title) for title in titles)
+            if score >= min_score:
+                results.append((score, display, matched, anime_id))
+        results.sort(key=lambda r: -r[0])
+        return results[:limit]
+
+class AnimeCatalog:
+    """On-disk snapshot of the most popular anime with an in-memory title index
+
+    The snapshot is a gzipped JSON file of Media objects in popularity
+    order, refreshed in the background every CATALOG_REFRESH_INTERVAL.
+    Searches match every query word against title/synonym words, the last
+    one as a prefix, and rank exact and prefix title matches first. A
+    FuzzyTitleIndex over the same titles backs typo-tolerant lookups.
+    """
+
+    REFRESH_PAGE_SIZE = 50  # API's per-page limit
+
+    def __init__(self, path=CATALOG_PATH, max_entries=CATALOG_MAX_ENTRIES,
+                 refresh_interval=CATALOG_REFRESH_INTERVAL):
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.fetched_at = 0.0
+        self._media = []  # popularity rank -> Media
+        self._by_id = {}
+        self._titles = []  # rank -> normalized titles
+        self._postings = {}  # title word -> ranks containing it
+        self._words = []  # sorted title words, for prefix lookups
+        self.fuzzy = FuzzyTitleIndex()
+        self._task = None
+        self._loaded_mtime = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._media)
+
+    def age(self):
+        return time.time() - self.fetched_at if self.fetched_at else None
+
+    def _build(self, media_list, fetched_at):
+        """Index `media_list` and swap it in as the current snapshot"""
+        media_list = [m for m in media_list if m and m.get("id")][:self.max_entries]
+        titles = []
+        postings = {}
+        fuzzy = FuzzyTitleIndex()
+        for rank, media in enumerate(media_list):
+            names = media_titles(media)
+            normalized = list(dict.fromkeys(n for n in map(normalize_title, names) if n))
+            titles.append(normalized)
+            fuzzy.add(media["id"], names)
+            for word in {w for name in normalized for w in name.split()}:
+                postings.setdefault(word, []).append(rank)
+
+        self._media = media_list
+        self._by_id = {media["id"]: media for media in media_list}
+        self._titles = titles
+        self._postings = postings
+        self._words = sorted(postings)
+        self.fuzzy = fuzzy
+        self.fetched_at = fetched_at
+
+    def _ranks_with_prefix(self, prefix):
+        ranks = set()
+        i = bisect.bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            ranks.update(self._postings[self._words[i]])
+            i += 1
+        return ranks
+
+    def match(self, query):
+        """Popularity ranks matching `query`, best first"""
+        normalized = normalize_title(query)
+        words = normalized.split()
+        if not words or not self._media:
+            return []
+
+        candidates = self._ranks_with_prefix(words[-1])
+        for word in words[:-1]:
+            if not candidates:
+                break
+            candidates.intersection_update(self._postings.get(word, ()))
+
+        def score(rank):
+            titles = self._titles[rank]
+            if normalized in titles:
+                return (0, rank)
+            if any(title.startswith(normalized) for title in titles):
+                return (1, rank)
+            return (2, rank)
+
+        return sorted(candidates, key=score)
+
+    def search_page(self, query, page=1, per_page=10):
+        """A Page-shaped result like the API's, or None when nothing matches"""
+        ranks = self.match(query)
+        if not ranks:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        last_page = -(-len(ranks) // per_page)
+        start = (page - 1) * per_page
+        return {
+            "pageInfo": {
+                "total": len(ranks),
+                "currentPage": page,
+                "lastPage": last_page,
+                "hasNextPage": page < last_page,
+            },
+            "media": [self._media[rank] for rank in ranks[start:start + per_page]],
+        }
+
+    def get(self, anime_id):
+        return self._by_id.get(int(anime_id))
+
+    def _read(self):
+        with gzip.open(self.path, "rb") as f:
+            return json_loads(f.read())
+
+    def _write(self, snapshot):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+
+    async def load(self):
+        """Load the last snapshot from disk, if there is one"""
+        try:
+            self._loaded_mtime = os.path.getmtime(self.path)
+            snapshot = await asyncio.to_thread(self._read)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read catalog snapshot {self.path}: {str(e)}")
+            return
+        self._build(snapshot.get("media") or [], snapshot.get("fetched_at") or 0.0)
+        logger.info(f"Loaded {len(self)} anime from catalog snapshot {self.path}")
+
+    async def refresh(self, anime_search):
+        """Page through the API by popularity and replace the snapshot"""
+        media_list = []
+        page = 1
+        while len(media_list) < self.max_entries:
+            # Background work: let user queries have the GraphQL slots and rate budget first
+            while anime_search.upstream_saturated() or not anime_search.rate_limiter.has_spare():
+                await asyncio.sleep(1)
+
+            result = await anime_search._execute_graphql_query(
+                GRAPHQL_QUERIES["catalog_page"], {"page": page, "perPage": self.REFRESH_PAGE_SIZE}, "catalog_refresh"
+            )
+            page_data = ((result or {}).get("data") or {}).get("Page")
+            if not page_data:
+                logger.error(f"Catalog refresh stopped at page {page}: {result.get('errors') if result else 'No result'}")
+                return False
+
+            media_list.extend(m for m in page_data.get("media") or [] if m)
+            if not (page_data.get("pageInfo") or {}).get("hasNextPage"):
+                break
+            page += 1
+
+        fetched_at = time.time()
+        self._build(media_list, fetched_at)
+        try:
+            await asyncio.to_thread(self._write, {"fetched_at": fetched_at, "media": self._media})
+        except OSError as e:
+            logger.error(f"Could not write catalog snapshot {self.path}: {str(e)}")
+        logger.info(f"Catalog refreshed with {len(self)} anime")
+        return True
+
+    async def _refresh_loop(self, anime_search):
+        while True:
+            age = self.age()
+            if age is not None and age < self.refresh_interval:
+                await asyncio.sleep(self.refresh_interval - age)
+            try:
+                if not await self.refresh(anime_search):
+                    await asyncio.sleep(min(self.refresh_interval, 300))
+            except Exception as e:
+                logger.exception(f"Catalog refresh failed: {str(e)}")
+                await asyncio.sleep(min(self.refresh_interval, 300))
+
+    async def _follow_loop(self):
+        """Reload the snapshot whenever another process has replaced it"""
+        while True:
+            await asyncio.sleep(min(self.refresh_interval, 60))
+            try:
+                modified = os.path.getmtime(self.path)
+            except OSError:
+                continue
+            if modified > self._loaded_mtime:
+                await self.load()
+
+    def start(self, anime_search, refresh=True):
+        """Keep the snapshot fresh in the background, fetching it or following the file"""
+        if self._task is None:
+            loop = self._refresh_loop(anime_search) if refresh else self._follow_loop()
+            self._task = asyncio.create_task(loop)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self):
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses, "age": self.age()}
+
+class FileIdStore(SqliteStore):
+    """Persistent map of anime_id -> Telegram file_id of its uploaded cover
+
+    Sharded workers share the file, so, like SqliteCacheStore, lookups use a
+    reader with a short busy timeout and writes are queued to the store's
+    thread. Until a queued delete lands, the anime_id is remembered as
+    deleted so the stale row isn't read back.
+    """
+
+    def __init__(self, path=COVER_DB_PATH):
+        self.path = path
+        self._memory = {}
+        self._deleted = set()
+        self._db = None
+        self._reader = None
+
+        if not path:
+            return
+
+        try:
+            super().__init__(path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cover_file_ids ("
+                "anime_id INTEGER PRIMARY KEY, file_id TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._reader = open_sqlite(path, timeout=self.READ_TIMEOUT)
+            logger.info(f"Cover file_id store opened at {path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Could not open cover store {path}, keeping file_ids in memory: {str(e)}")
+            if self._db is not None:
+                self._close()
+            self._db = None
+
+    def __len__(self):
+        if self._reader is None:
+            return len(self._memory)
+        try:
+            return self._reader.execute("SELECT COUNT(*) FROM cover_file_ids").fetchone()[0]
+        except sqlite3.Error:
+            return len(self._memory)
+
+    def get(self, anime_id):
+        file_id = self._memory.get(anime_id)
+        if file_id is not None or self._reader is None or anime_id in self._deleted:
+            return file_id
+
+        # Read through so file_ids stored by an earlier run (or another process) are found
+        try:
+            row = self._reader.execute(
+                "SELECT file_id FROM cover_file_ids WHERE anime_id = ?", (anime_id,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Cover store lookup failed: {str(e)}")
+            return None
+
+        if row:
+            self._memory[anime_id] = row[0]
+            return row[0]
+        return None
+
+    def set(self, anime_id, file_id):
+        if self._memory.get(anime_id) == file_id:
+            return
+        self._memory[anime_id] = file_id
+        self._deleted.discard(anime_id)
+        if self._db is None:
+            return
+        self._thread.submit(
+            self._write_logged,
+            "INSERT OR REPLACE INTO cover_file_ids (anime_id, file_id, updated_at) VALUES (?, ?, ?)",
+            (anime_id, file_id, time.time())
+        )
+
+    def delete(self, anime_id):
+        self._memory.pop(anime_id, None)
+        if self._db is None:
+            return
+        self._deleted.add(anime_id)
+        self._thread.submit(self._write_logged, "DELETE FROM cover_file_ids WHERE anime_id = ?", (anime_id,))
+
+    def _write_logged(self, statement, params):
+        try:
+            self._write(statement, params)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not update cover file_id {params[0]}: {str(e)}")
+
+    def _prune(self):
+        """Nothing to drop: one row per uploaded cover, kept for good"""
+
+    async def close(self):
+        if self._db is not None:
+            await asyncio.to_thread(self._close)
+            self._reader.close()
+            self._db = None
+
+class PagePrefetcher:
+    """Warms the response cache with the pages next to the one a user is viewing"""
+
+    def __init__(self, anime_search, sessions, max_concurrent=PREFETCH_MAX_CONCURRENT,
+                 include_previous=PREFETCH_PREVIOUS):
+        self.anime_search = anime_search
+        self.sessions = sessions
+        self.max_concurrent = max_concurrent
+        self.include_previous = include_previous
+        self._tasks = {}  # user_id -> running prefetch task
+        self.scheduled = 0
+        self.skipped = 0
+
+    def schedule(self, user_id, query, page, total_pages):
+        """Start a background prefetch for the pages adjacent to `page`"""
+        self.cancel(user_id)
+
+        pages = []
+        if page < total_pages:
+            pages.append(page + 1)
+        if self.include_previous and page > 1:
+            pages.append(page - 1)
+        pages = [p for p in pages if not self.anime_search.is_search_cached(query, p)]
+        if not pages:
+            return
+
+        # Prefetches are best-effort: when too many are running, or user
+        # queries are waiting for a GraphQL slot, skip rather than queue
+        if len(self._tasks) >= self.max_concurrent or self.anime_search.upstream_saturated():
+            self.skipped += 1
+            return
+
+        task = asyncio.create_task(self._prefetch(user_id, query, pages))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda t: self._forget(user_id, t))
+        self.scheduled += 1
+
+    def _forget(self, user_id, task):
+        if self._tasks.get(user_id) is task:
+            del self._tasks[user_id]
+
+    async def _prefetch(self, user_id, query, pages):
+        for page in pages:
+            # Yield first so the handler's own replies go out before we hit the API
+            await asyncio.sleep(0)
+            # exists() doesn't count as activity, so an idle session still expires
+            if not await self.sessions.exists(user_id):
+                return
+            try:
+                await self.anime_search.search_anime(query, page=page)
+            except Exception as e:
+                logger.debug(f"Prefetch of page {page} for '{query}' failed: {str(e)}")
+
+    def cancel(self, user_id):
+        task = self._tasks.pop(user_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def close(self):
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+class CoverCache:
+    """Tracks CDN cover availability and Telegram file_ids of uploaded covers"""
+
+    # Fragments of Telegram errors that mean the photo itself was rejected
+    COVER_ERROR_HINTS = ("url", "file", "photo", "image", "web page content")
+
+    def __init__(self, file_ids=None):
+        self.availability = ResponseCache(ttl=COVER_AVAILABLE_TTL, max_entries=COVER_CACHE_MAX_ENTRIES)
+        self.file_ids = file_ids if file_ids is not None else FileIdStore()
+
+    def photo_candidates(self, anime_id, cover_url):
+        """Photos to try in order: a known file_id first, then the CDN URL"""
+        candidates = []
+        file_id = self.file_ids.get(anime_id)
+        if file_id:
+            candidates.append(file_id)
+        if cover_url and self.availability.get(anime_id) is not False:
+            candidates.append(cover_url)
+        return candidates
+
+    def remember_upload(self, anime_id, message):
+        """Store the file_id Telegram assigned to a sent cover"""
+        self.availability.set(anime_id, True)
+        if message is not None and message.photo:
+            self.file_ids.set(anime_id, message.photo[-1].file_id)
+
+    def mark_failed(self, anime_id, photo, cover_url):
+        """Forget a rejected file_id, or remember that the CDN has no cover"""
+        if photo == cover_url:
+            self.availability.set(anime_id, False, ttl=COVER_MISSING_TTL)
+        else:
+            self.file_ids.delete(anime_id)
+
+    @classmethod
+    def is_cover_error(cls, error):
+        message = str(error).lower()
+        return any(hint in message for hint in cls.COVER_ERROR_HINTS)
+
+class SessionStore(ABC):
+    """Search sessions per user: only the query, current page and total pages"""
+
+    FIELDS = ("query", "current_page", "total_pages")
+
+    @abstractmethod
+    async def get(self, user_id):
+        """The user's session (refreshing its idle timer), or None"""
+
+    @abstractmethod
+    async def exists(self, user_id):
+        """Whether the user has a live session, without refreshing its idle timer"""
+
+    @abstractmethod
+    async def set(self, user_id, session):
+        """Store the session and reset its idle timer"""
+
+    @abstractmethod
+    async def delete(self, user_id):
+        """Forget the user's session"""
+
+    @abstractmethod
+    async def size(self):
+        """Number of sessions stored"""
+
+    async def close(self):
+        pass
+
+class MemorySessionStore(SessionStore):
+    """In-process sessions with an idle TTL and an LRU cap"""
+
+    def __init__(self, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._sessions = OrderedDict()  # user_id -> (last_seen, query, current_page, total_pages)
+
+    async def get(self, user_id):
+        entry = self._sessions.get(user_id)
+        if entry is None:
+            return None
+
+        now = time.monotonic()
+        if now - entry[0] > self.ttl:
+            del self._sessions[user_id]
+            return None
+
+        # Reading a session counts as activity
+        self._sessions[user_id] = (now,) + entry[1:]
+        self._sessions.move_to_end(user_id)
+        return dict(zip(self.FIELDS, entry[1:]))
+
+    async def exists(self, user_id):
+        entry = self._sessions.get(user_id)
+        return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    async def set(self, user_id, session):
+        self._sessions[user_id] = (time.monotonic(),) + tuple(session[f] for f in self.FIELDS)
+        self._sessions.move_to_end(user_id)
+        while len(self._sessions) > self.max_entries:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, user_id):
+        self._sessions.pop(user_id, None)
+
+    async def size(self):
+        return len(self._sessions)
+
+class SqliteSessionStore(SqliteStore, SessionStore):
+    """Sessions persisted in SQLite so they survive restarts (and are shared by sharded workers)"""
+
+    def __init__(self, path=SESSION_DB_PATH, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES):
+        super().__init__(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "user_id INTEGER PRIMARY KEY, query TEXT NOT NULL, current_page INTEGER NOT NULL, "
+            "total_pages INTEGER NOT NULL, last_seen REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen)")
+        logger.info(f"Session store opened at {path}")
+
+    async def get(self, user_id):
+        return await self._run(self._get, user_id)
+
+    def _get(self, user_id):
+        now = time.time()
+        row = self._db.execute(
+            "SELECT query, current_page, total_pages, last_seen FROM sessions WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[3] > self.ttl:
+            self._db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+            return None
+
+        self._db.execute("UPDATE sessions SET last_seen = ? WHERE user_id = ?", (now, user_id))
+        return dict(zip(self.FIELDS, row[:3]))
+
+    async def exists(self, user_id):
+        row = await self._run(lambda: self._db.execute(
+            "SELECT 1 FROM sessions WHERE user_id = ? AND last_seen >= ?", (user_id, time.time() - self.ttl)
+        ).fetchone())
+        return row is not None
+
+    async def set(self, user_id, session):
+        await self._run(
+            self._write,
+            "INSERT OR REPLACE INTO sessions (user_id, query, current_page, total_pages, last_seen) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, session["query"], session["current_page"], session["total_pages"], time.time())
+        )
+
+    def _prune(self):
+        """Drop idle sessions, then the least recently used beyond the cap"""
+        self._db.execute("DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.ttl,))
+        self._db.execute(
+            "DELETE FROM sessions WHERE user_id IN ("
+            "SELECT user_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    async def delete(self, user_id):
+        await self._run(self._db.execute, "DELETE FROM sessions WHERE user_id = ?", (user_id,))
+
+    async def size(self):
+        return await self._run(lambda: self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0])
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+class RedisSessionStore(SessionStore):
+    """Sessions in a Redis-compatible server, shared by every bot replica
+
+    Idle expiry uses key TTLs; the entry cap is left to the server's
+    maxmemory eviction policy.
+    """
+
+    KEY_PREFIX = "animebot:session:"
+
+    def __init__(self, url=SESSION_REDIS_URL, ttl=SESSION_TTL):
+        if redis_asyncio is None:
+            raise RuntimeError("SESSION_BACKEND=redis requires the 'redis' package")
+        self.ttl = int(ttl)
+        self._redis = redis_asyncio.from_url(url, decode_responses=True)
+
+    async def get(self, user_id):
+        key = f"{self.KEY_PREFIX}{user_id}"
+        raw = await self._redis.get(key)
+        if raw is None:
+            return None
+        await self._redis.expire(key, self.ttl)
+        return dict(zip(self.FIELDS, json.loads(raw)))
+
+    async def exists(self, user_id):
+        return await self._redis.exists(f"{self.KEY_PREFIX}{user_id}") > 0
+
+    async def set(self, user_id, session):
+        value = json.dumps([session[f] for f in self.FIELDS])
+        await self._redis.set(f"{self.KEY_PREFIX}{user_id}", value, ex=self.ttl)
+
+    async def delete(self, user_id):
+        await self._redis.delete(f"{self.KEY_PREFIX}{user_id}")
+
+    async def size(self):
+        count = 0
+        async for _ in self._redis.scan_iter(match=f"{self.KEY_PREFIX}*", count=1000):
+            count += 1
+        return count
+
+    async def close(self):
+        await self._redis.close()
+
+def create_session_store(backend=SESSION_BACKEND):
+    """Build the session store selected by SESSION_BACKEND"""
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "redis":
+        return RedisSessionStore()
+    if backend != "memory":
+        logger.warning(f"Unknown SESSION_BACKEND '{backend}', using in-memory sessions")
+    return MemorySessionStore()
+
+class UserOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates from different users concurrently, each user's in arrival order
+
+    process_update is declared @final in PTB, but it is the only hook that
+    runs before the global slot is taken, and an update waiting for its
+    user's earlier ones must not hold a slot. So it is overridden on
+    purpose and still takes the slot through super().process_update.
+    PTB is pinned to the exact version this was checked against
+    (requirements.txt); re-check the override before upgrading.
+    """
+
+    def __init__(self, max_concurrent_updates=MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._user_locks = {}  # user_id -> [lock, updates holding or waiting for it]
+        self.queued = 0  # updates waiting for their user's turn or a free slot
+        self.active = 0
+        self.processed = 0
+
+    @property
+    def queue_depth(self):
+        return self.queued
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def process_update(self, update, coroutine):  # type: ignore[misc]  # @final upstream, see class docstring
+        waiting = [True]
+        run = self._run(coroutine, time.perf_counter(), waiting)
+        self.queued += 1
+        try:
+            user = getattr(update, "effective_user", None)
+            # Inline queries are independent lookups on a tight deadline, so
+            # they don't wait behind the user's chat updates
+            if user is None or getattr(update, "inline_query", None) is not None:
+                await super().process_update(update, run)
+                return
+
+            # Wait for the user's earlier updates before taking a global slot,
+            # so one busy user can't hold slots other users could use
+            entry = self._user_locks.get(user.id)
+            if entry is None:
+                entry = self._user_locks[user.id] = [asyncio.Lock(), 0]
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    await super().process_update(update, run)
+            finally:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._user_locks.pop(user.id, None)
+        finally:
+            if waiting[0]:
+                # Cancelled before the handlers ever started
+                self.queued -= 1
+                run.close()
+                coroutine.close()
+
+    async def _run(self, coroutine, enqueued, waiting):
+        waiting[0] = False
+        self.queued -= 1
+        self.active += 1
+        started = time.perf_counter()
+        UPDATE_QUEUE_SECONDS.observe(started - enqueued)
+        try:
+            await coroutine
+        finally:
+            UPDATE_HANDLER_SECONDS.observe(time.perf_counter() - started)
+            self.active -= 1
+            self.processed += 1
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+async def register_webhook(bot):
+    """Point Telegram at WEBHOOK_URL, if one is configured"""
+    if not WEBHOOK_URL:
+        logger.info("WEBHOOK_URL not set, serving without registering the webhook")
+        return
+    await bot.set_webhook(
+        url=WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=Update.ALL_TYPES,
+        drop_pending_updates=DROP_PENDING_UPDATES
+    )
+    logger.info(f"Webhook registered at {WEBHOOK_URL}")
+
+class WebhookServer:
+    """Embedded aiohttp server that feeds webhook updates into the application"""
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+    def __init__(self, application, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                 listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, graphql_stats=None, socket_path=None):
+        self.application = application
+        self.graphql_stats = graphql_stats
+        self.path = path
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        self.socket_path = socket_path  # serve on a unix socket instead (sharded workers)
+        self.accepting = True
+        self.received = 0
+        self.rejected = 0
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self._runner = None
+
+    async def handle_update(self, request):
+        if self.secret and not hmac.compare_digest(request.headers.get(self.SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=403, text="invalid secret token")
+
+        # While draining, Telegram keeps the update and retries it later
+        if not self.accepting:
+            return web.Response(status=503, text="shutting down")
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.warning(f"Rejected malformed webhook update: {str(e)}")
+            return web.Response(status=400, text="malformed update")
+
+        await self.application.update_queue.put(update)
+        self.received += 1
+        return web.Response(text="ok")
+
+    async def handle_health(self, request):
+        return web.json_response({
+            "status": "ok" if self.accepting else "draining",
+            "pending_updates": self.application.update_queue.qsize(),
+            "queued_updates": getattr(self.application.update_processor, "queue_depth", 0),
+            "active_updates": getattr(self.application.update_processor, "active", 0),
+            "received": self.received,
+            "graphql": self.graphql_stats() if self.graphql_stats else None
+        })
+
+    async def start(self):
+        self._runner = web.AppRunner(self.web_app)
+        await self._runner.setup()
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)  # left over from a worker that died
+            await web.UnixSite(self._runner, self.socket_path).start()
+            logger.info(f"Webhook server listening on {self.socket_path}{self.path}")
+            return
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def drain(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Stop taking updates and wait for the queued ones to be picked up"""
+        self.accepting = False
+        deadline = time.monotonic() + timeout
+        while self.application.update_queue.qsize() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        left = self.application.update_queue.qsize()
+        if left:
+            logger.warning(f"Drain timed out with {left} updates still queued")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
 class TelegramBot:
-    def __init__(self):
+    def __init__(self, shard=None, shards=1):
+        self.shard = shard  # worker index in BOT_MODE=sharded, out of `shards` workers
         self.formatter = AnimeFormatter()
-        self.anime_search = AnimeSearch()
-        self.user_sessions = {}  # Store user search sessions
-        self.application = Application.builder().token(BOT_TOKEN).build()
+        self.catalog = AnimeCatalog() if CATALOG_ENABLED else None
+        shared_cache = SqliteCacheStore() if shard is not None else None
+        self.anime_search = AnimeSearch(
+            cache=ResponseCache(shared=shared_cache), catalog=self.catalog, processes=shards
+        )
+        self.covers = CoverCache(FileIdStore(COVER_DB_PATH))
+        session_backend = SESSION_BACKEND
+        if shard is not None and session_backend == "memory":
+            # Sessions must outlive a worker restart or a change in SHARD_WORKERS
+            session_backend = "sqlite"
+        self.user_sessions = create_session_store(session_backend)  # Store user search sessions
+        self.prefetcher = PagePrefetcher(self.anime_search, self.user_sessions)
+        self.update_processor = UserOrderedUpdateProcessor()
+        # Each sharded worker serves its own metrics on the ports after METRICS_PORT
+        metrics_port = METRICS_PORT + 1 + shard if METRICS_PORT and shard is not None else METRICS_PORT
+        self.metrics_server = MetricsServer(port=metrics_port) if metrics_port else None
+        self.inline_cache = ResponseCache(ttl=INLINE_CACHE_TTL, max_entries=INLINE_CACHE_MAX_ENTRIES)
+        self.format_pool = FormattingPool()
+        self.render_cache = ResponseCache(
+            ttl=RENDER_CACHE_TTL, max_entries=RENDER_CACHE_MAX_ENTRIES, max_bytes=RENDER_CACHE_MAX_BYTES
+        )
+        self._inline_tasks = {}  # user_id -> pending inline lookup
+        self.application = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(TELEGRAM_API_BASE_URL)
+            .base_file_url(TELEGRAM_API_FILE_URL)
+            .request(InstrumentedRequest(connection_pool_size=TELEGRAM_POOL_SIZE))
+            .concurrent_updates(self.update_processor)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+            .build()
+        )
         self.setup_handlers()
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Expose component state that is read at scrape time"""
+        search = self.anime_search
+        caches = {
+            "response": search.cache,
+            "cover_availability": self.covers.availability,
+            "inline": self.inline_cache,
+            "render": self.render_cache,
+        }
+
+        def per_cache(attr):
+            return lambda: {(name,): getattr(cache, attr) for name, cache in caches.items()}
+
+        def per_endpoint(read):
+            return lambda: {(e.url,): read(e) for e in search.endpoints}
+
+        breaker_states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+        METRICS.callback("animebot_cache_hits_total", "Cache hits", per_cache("hits"), ("cache",), "counter")
+        METRICS.callback("animebot_cache_misses_total", "Cache misses", per_cache("misses"), ("cache",), "counter")
+        METRICS.callback("animebot_cache_stale_hits_total", "Expired entries served because upstream failed",
+                         per_cache("stale_hits"), ("cache",), "counter")
+        METRICS.callback("animebot_cache_shared_hits_total", "Local misses answered by the shared cache",
+                         per_cache("shared_hits"), ("cache",), "counter")
+        METRICS.callback("animebot_cache_evictions_total", "Entries evicted by the LRU/memory cap",
+                         per_cache("evictions"), ("cache",), "counter")
+        METRICS.callback("animebot_cache_entries", "Entries currently cached",
+                         lambda: {(name,): len(cache) for name, cache in caches.items()}, ("cache",))
+        METRICS.callback("animebot_cache_bytes", "Estimated bytes held per cache",
+                         lambda: {(name,): cache.stats()["bytes"] for name, cache in caches.items()}, ("cache",))
+
+        METRICS.callback("animebot_graphql_coalesced_total", "Callers that shared an in-flight request",
+                         lambda: search.coalesced, type="counter")
+        METRICS.callback("animebot_graphql_abandoned_total", "Requests cancelled because every caller gave up",
+                         lambda: search.abandoned, type="counter")
+        METRICS.callback("animebot_graphql_in_flight", "GraphQL POSTs currently running", lambda: search.upstream_active)
+        METRICS.callback("animebot_graphql_waiting", "GraphQL calls waiting for a free slot", lambda: search.upstream_waiting)
+        METRICS.callback("animebot_graphql_rate_limited_total", "Calls refused by the rate limiter",
+                         lambda: search.rate_limiter.rejected, type="counter")
+        METRICS.callback("animebot_graphql_retries_total", "Retried GraphQL attempts", lambda: search.retries, type="counter")
+        METRICS.callback("animebot_graphql_hedged_total", "Hedged second requests sent", lambda: search.hedged, type="counter")
+        METRICS.callback("animebot_graphql_hedge_wins_total", "Hedged requests that answered first",
+                         lambda: search.hedge_wins, type="counter")
+        METRICS.callback("animebot_graphql_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+                         per_endpoint(lambda e: breaker_states[e.breaker.state]), ("endpoint",))
+        METRICS.callback("animebot_graphql_breaker_rejections_total", "Calls rejected by an open breaker",
+                         per_endpoint(lambda e: e.breaker.rejected), ("endpoint",), "counter")
+
+        if self.catalog is not None:
+            catalog = self.catalog
+            METRICS.callback("animebot_catalog_entries", "Anime in the local catalog snapshot", lambda: len(catalog))
+            METRICS.callback("animebot_catalog_hits_total", "Searches answered from the local catalog",
+                             lambda: catalog.hits, type="counter")
+            METRICS.callback("animebot_catalog_misses_total", "Searches the local catalog passed to the API",
+                             lambda: catalog.misses, type="counter")
+            METRICS.callback("animebot_catalog_age_seconds", "Age of the local catalog snapshot",
+                             lambda: catalog.age() or 0)
+
+        METRICS.callback("animebot_fuzzy_titles", "Titles seen in API results, indexed for fuzzy search",
+                         lambda: len(search.titles))
+        METRICS.callback("animebot_search_corrected_total", "Searches rewritten to a fuzzy-matched title",
+                         lambda: search.corrected, type="counter")
+
+        METRICS.callback("animebot_user_sessions", "Search sessions currently stored", self.user_sessions.size)
+        METRICS.callback("animebot_cover_file_ids", "Cover file_ids known", lambda: len(self.covers.file_ids))
+        METRICS.callback("animebot_update_queue_depth", "Updates waiting for a handler slot",
+                         lambda: self.update_processor.queue_depth)
+        METRICS.callback("animebot_updates_in_progress", "Updates whose handlers are running",
+                         lambda: self.update_processor.active)
+        METRICS.callback("animebot_format_pending", "Formatting chunks queued or running in the pool",
+                         lambda: self.format_pool.pending)
+        METRICS.callback("animebot_format_offloaded_total", "Posts formatted in the pool",
+                         lambda: self.format_pool.offloaded, type="counter")
+        METRICS.callback("animebot_format_inline_total", "Batched posts formatted on the event loop",
+                         lambda: self.format_pool.inline, type="counter")
+        METRICS.callback("animebot_prefetch_scheduled_total", "Background page prefetches started",
+                         lambda: self.prefetcher.scheduled, type="counter")
+        METRICS.callback("animebot_prefetch_skipped_total", "Prefetches skipped to protect user queries",
+                         lambda: self.prefetcher.skipped, type="counter")
+
+    async def _post_init(self, application):
+        """Open shared resources once the application is initialized"""
+        await self.anime_search.start()
+        self.format_pool.start()
+        if self.metrics_server is not None:
+            await self.metrics_server.start()
+        if self.catalog is not None:
+            await self.catalog.load()
+            # One sharded worker refreshes the snapshot; the others reload its file
+            self.catalog.start(self.anime_search, refresh=not self.shard)
+
+        # Test API connection
+        test_result = await self.anime_search.search_anime("naruto", page=1, per_page=1)
+        if test_result:
+            logger.info("✅ GraphQL API connection successful!")
+        else:
+            logger.warning("⚠️ GraphQL API test failed, but continuing anyway...")
+
+    async def _post_shutdown(self, application):
+        """Release shared resources after the application has stopped"""
+        await self.prefetcher.close()
+        if self.catalog is not None:
+            await self.catalog.close()
+        await self.anime_search.close()
+        if self.anime_search.cache.shared is not None:
+            self.anime_search.cache.shared.close()
+        await self.format_pool.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        await self.covers.file_ids.close()
+        await self.user_sessions.close()
+        logger.info(
+            f"GraphQL stats: {self.anime_search.stats()}, "
+            f"updates processed: {self.update_processor.processed}"
+        )
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        help_text = """\U0001F38C <b>Anime Formatter Bot</b> \U0001F38C
+        help_text = f"""\U0001F38C <b>Anime Formatter Bot</b> \U0001F38C
 
 Send anime information in this exact format:
 
@@ -301,8 +2841,14 @@ Send anime information in this exact format:
 
 (Source: Some Source)</pre>
 
+Several anime in one message work too: end each with its (Source: ...) line.
+
 Or simply send an anime title to search from AniList database!
 
+Or type <code>@{context.bot.username} title</code> in any chat to post without leaving it.
+
+Need a whole lineup? Use <code>/bulk 154587, 113415</code> with AniList ids, or one title per line after /bulk.
+
 The bot will format it with:
 • Bold headings with special characters
 • Truncated synopsis (max 5 lines)
@@ -318,29 +2864,40 @@ The bot will format it with:
         try:
             message_text = update.message.text
             logger.info(f"Processing manual format from user {update.effective_user.id}")
-            anime_data = self.formatter.parse_anime_info(message_text)
-            if anime_data:
-                formatted_text, _ = self.formatter.format_html(anime_data)
-                await update.message.reply_text(
-                    formatted_text,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True
-                )
-                logger.info("Successfully formatted and sent anime information")
-            else:
-                error_message = """\u274C <b>Invalid Format</b>
+
+            entries = self.formatter.split_manual_entries(message_text)
+            if len(entries) > 1:
+                await self._format_manual_entries(update.message, entries)
+                return
+
+            try:
+                anime_data = self.formatter.parse_anime_record(message_text)
+            except AnimeParseError as e:
+                missing = ", ".join(e.missing_fields)
+                error_message = f"""\u274C <b>Invalid Format</b>
+
+Missing: <b>{missing}</b>
 
 Please use the correct format. Send /start to see the example format.
 
 Make sure your message includes:
 • Anime title
-• All required fields (‣ Genres, ‣ Type, etc.)
+• Fields like ‣ Genres, ‣ Type, ‣ No of episodes
 • Synopsis section
-• Proper line breaks between sections
+• Each field on its own line
 
 Or simply send an anime title to search!"""
                 await update.message.reply_text(error_message, parse_mode='HTML')
-                logger.warning("Invalid format received")
+                logger.warning(f"Invalid format received: {str(e)}")
+                return
+
+            formatted_text, _ = self.formatter.format_html(anime_data)
+            await update.message.reply_text(
+                formatted_text,
+                parse_mode='HTML',
+                disable_web_page_preview=True
+            )
+            logger.info("Successfully formatted and sent anime information")
         except Exception as e:
             logger.exception(f"Error processing message: {str(e)}")
             await update.message.reply_text(
@@ -348,6 +2905,26 @@ Or simply send an anime title to search!"""
                 parse_mode='HTML'
             )
 
+    async def _format_manual_entries(self, message, entries):
+        """Format a multi-anime dump in the formatting pool and reply with every post in order"""
+        if len(entries) > MANUAL_MAX_ENTRIES:
+            await message.reply_text(f"❌ At most {MANUAL_MAX_ENTRIES} anime per message.")
+            return
+
+        results = await self.format_pool.map(render_manual, entries)
+        skipped = []
+        for number, (formatted_text, missing) in enumerate(results, 1):
+            if formatted_text is None:
+                skipped.append(f"#{number}: {', '.join(missing)}")
+                continue
+            await message.reply_text(formatted_text, parse_mode='HTML', disable_web_page_preview=True)
+
+        summary = f"✅ Formatted {len(results) - len(skipped)} of {len(results)} entries."
+        if skipped:
+            summary += "\n❌ Missing fields in " + "; ".join(skipped)
+        await message.reply_text(summary)
+        logger.info(f"Formatted {len(results)} manual entries ({len(skipped)} skipped)")
+
     async def handle_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle anime search requests"""
         try:
@@ -358,32 +2935,249 @@ Or simply send an anime title to search!"""
                 await update.message.reply_text("❌ Please enter at least 3 characters to search.")
                 return
 
-            result = self.anime_search.search_anime(query, page=1)
+            # Fix obvious typos against known titles before spending a round-trip
+            search_query = (self.anime_search.correct_query(query) if FUZZY_ENABLED else None) or query
+            result = await self.anime_search.search_anime(search_query, page=1)
+            if (not result or not result.get("media")) and search_query != query:
+                search_query = query
+                result = await self.anime_search.search_anime(query, page=1)
 
             if not result or not result.get("media"):
+                suggestions = self.anime_search.suggest(query) if FUZZY_ENABLED else []
+                if suggestions:
+                    keyboard = [
+                        [InlineKeyboardButton(self._button_label(title), callback_data=f"select_{anime_id}")]
+                        for _, title, _, anime_id in suggestions
+                    ]
+                    await update.message.reply_text(
+                        "❌ No anime found with that name. Did you mean:",
+                        reply_markup=InlineKeyboardMarkup(keyboard)
+                    )
+                    return
                 await update.message.reply_text("❌ No anime found with that name.")
                 return
 
-            self.user_sessions[user_id] = {
-                "query": query,
+            await self.user_sessions.set(user_id, {
+                "query": search_query,
                 "current_page": 1,
-                "total_pages": result["pageInfo"]["lastPage"],
-                "results": result["media"]
-            }
+                "total_pages": result["pageInfo"]["lastPage"]
+            })
 
             keyboard = self._create_search_keyboard(result["media"], user_id, 1, result["pageInfo"])
             reply_markup = InlineKeyboardMarkup(keyboard)
 
+            corrected = f" (corrected from '{query}')" if search_query != query else ""
             await update.message.reply_text(
-                f"🎞 Found {len(result['media'])} results for '{query}':\n\nSelect an anime:",
+                f"🎞 Found {len(result['media'])} results for '{search_query}'{corrected}:\n\nSelect an anime:",
                 reply_markup=reply_markup,
                 parse_mode='HTML'
             )
 
+            if PREFETCH_ENABLED:
+                self.prefetcher.schedule(user_id, search_query, 1, result["pageInfo"]["lastPage"])
+
         except Exception as e:
             logger.exception(f"Error handling search: {str(e)}")
             await update.message.reply_text("❌ Error searching for anime. Please try again.")
 
+    @staticmethod
+    def _parse_bulk_items(text):
+        """One item per line, or comma separated on a single line; digits are AniList ids"""
+        lines = [line.strip() for line in text.splitlines() if line.strip()]
+        if len(lines) == 1:
+            lines = [part.strip() for part in lines[0].split(",") if part.strip()]
+        return [int(item) if item.isdigit() else item for item in lines]
+
+    async def handle_bulk(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Generate posts for many anime at once: /bulk <ids or titles>"""
+        try:
+            parts = update.message.text.split(maxsplit=1)
+            items = self._parse_bulk_items(parts[1] if len(parts) > 1 else "")
+            if not items:
+                await update.message.reply_text(
+                    "Usage: <code>/bulk 154587, 113415</code> or one title per line after /bulk",
+                    parse_mode='HTML'
+                )
+                return
+            if len(items) > BULK_MAX_ITEMS:
+                await update.message.reply_text(f"❌ At most {BULK_MAX_ITEMS} anime per /bulk request.")
+                return
+
+            logger.info(f"Bulk request for {len(items)} anime from user {update.effective_user.id}")
+            results = await self.anime_search.get_anime_batch(items)
+
+            found = [media for _, media in results if media is not None]
+            not_found = [str(item) for item, media in results if media is None]
+            rendered = await self._render_media_batch(found)
+            posts = [
+                (media["id"], formatted_text, cover_url)
+                for media, (formatted_text, cover_url) in zip(found, rendered)
+            ]
+
+            await self._send_posts(update.message, posts)
+
+            summary = f"✅ Generated {len(posts)} post(s)."
+            if not_found:
+                summary += f"\n❌ Not found: {', '.join(not_found)}"
+            await update.message.reply_text(summary)
+
+        except Exception as e:
+            logger.exception(f"Error handling bulk request: {str(e)}")
+            await update.message.reply_text("❌ Error generating posts. Please try again.")
+
+    async def _send_posts(self, message, posts):
+        """Send (anime_id, caption, cover_url) posts in order, grouping consecutive covers into media groups"""
+        photo_run = []
+        for anime_id, formatted_text, cover_url in posts:
+            candidates = self.covers.photo_candidates(anime_id, cover_url)
+            if candidates:
+                photo_run.append((anime_id, formatted_text, cover_url, candidates[0]))
+                continue
+            await self._send_photo_run(message, photo_run)
+            photo_run = []
+            await message.reply_text(formatted_text, parse_mode='HTML', disable_web_page_preview=True)
+        await self._send_photo_run(message, photo_run)
+
+    async def _send_photo_run(self, message, photo_posts):
+        """Send consecutive cover posts as media groups of up to MEDIA_GROUP_LIMIT"""
+        for start in range(0, len(photo_posts), MEDIA_GROUP_LIMIT):
+            group = photo_posts[start:start + MEDIA_GROUP_LIMIT]
+            if len(group) > 1:
+                try:
+                    sent = await message.reply_media_group(media=[
+                        InputMediaPhoto(media=photo, caption=formatted_text, parse_mode='HTML')
+                        for _, formatted_text, _, photo in group
+                    ])
+                    for (anime_id, _, _, _), sent_message in zip(group, sent):
+                        self.covers.remember_upload(anime_id, sent_message)
+                    continue
+                except TelegramError as e:
+                    # One bad cover fails the whole group; send them one by one instead
+                    logger.warning(f"Media group failed, sending posts individually: {str(e)}")
+
+            for anime_id, formatted_text, cover_url, _ in group:
+                await self._send_post(message, anime_id, formatted_text, cover_url)
+
+    async def handle_inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer "@bot title" with ready-to-post results"""
+        inline_query = update.inline_query
+        user_id = inline_query.from_user.id
+        text = inline_query.query.strip()
+        try:
+            page = max(1, int(inline_query.offset or 1))
+        except ValueError:
+            page = 1
+
+        if len(text) < INLINE_MIN_QUERY:
+            await inline_query.answer([], cache_time=INLINE_CACHE_TIME)
+            return
+
+        # A newer keystroke supersedes this user's pending lookup
+        previous = self._inline_tasks.get(user_id)
+        if previous is not None:
+            previous.cancel()
+        task = asyncio.create_task(self._inline_results(text, page))
+        self._inline_tasks[user_id] = task
+        try:
+            media, next_offset = await task
+        except asyncio.CancelledError:
+            if self._inline_tasks.get(user_id) is not task:
+                return  # superseded: Telegram only shows the newest answer anyway
+            raise
+        except Exception as e:
+            logger.exception(f"Error handling inline query '{text}': {str(e)}")
+            return
+        finally:
+            if self._inline_tasks.get(user_id) is task:
+                del self._inline_tasks[user_id]
+
+        try:
+            await inline_query.answer(
+                [self._inline_result(m) for m in media],
+                cache_time=INLINE_CACHE_TIME,
+                next_offset=next_offset
+            )
+        except BadRequest as e:
+            # Usually "query is too old": the user typed on before we answered
+            logger.debug(f"Inline answer for '{text}' rejected: {str(e)}")
+
+    async def _inline_results(self, text, page):
+        """(media list, next_offset) for an inline query, from cache when possible"""
+        normalized = normalize_title(text)
+        key = (normalized, page)
+        cached = self.inline_cache.get(key)
+        if cached is None and page == 1:
+            cached = self._inline_from_prefix(normalized)
+        if cached is not None:
+            return cached["media"], cached["next_offset"]
+
+        # Debounce: if the user keeps typing, this task is cancelled here
+        # before it costs an upstream request
+        await asyncio.sleep(INLINE_DEBOUNCE)
+        result = await self.anime_search.search_anime(text, page=page, cancel_if_abandoned=True, detail=True)
+        media = [m for m in (result or {}).get("media") or [] if m and m.get("id")]
+        page_info = (result or {}).get("pageInfo") or {}
+        entry = {
+            "media": media,
+            "next_offset": str(page + 1) if page_info.get("hasNextPage") else "",
+            # Every match fits on this page, so longer queries can filter it locally
+            "complete": page == 1 and not page_info.get("hasNextPage"),
+        }
+        if result is not None:
+            self.inline_cache.set(key, entry)
+        return entry["media"], entry["next_offset"]
+
+    def _inline_from_prefix(self, normalized):
+        """Narrow a cached, complete answer for a shorter prefix of this query"""
+        words = normalized.split()
+        if not words:
+            return None
+        for end in range(len(normalized) - 1, INLINE_MIN_QUERY - 1, -1):
+            key = (normalized[:end].strip(), 1)
+            if key not in self.inline_cache:
+                continue
+            entry = self.inline_cache.get(key)
+            if entry is None or not entry["complete"]:
+                return None
+
+            def matches(media):
+                title_words = " ".join(map(normalize_title, media_titles(media))).split()
+                return all(any(t.startswith(word) for t in title_words) for word in words)
+
+            return {"media": [m for m in entry["media"] if matches(m)], "next_offset": ""}
+        return None
+
+    def _inline_result(self, media):
+        """One inline result: the cover (cached file_id first) captioned with the post, else text"""
+        anime_id = media["id"]
+        formatted_text, cover_url = self._format_anime_from_api(media, anime_id)
+        title = (media.get("title") or {}).get("english") or (media.get("title") or {}).get("romaji") or "Untitled"
+        details = [media.get("format"), f"{media['episodes']} eps" if media.get("episodes") else None,
+                   (media.get("status") or "").replace("_", " ").title() or None]
+        description = " • ".join(d for d in details if d)
+
+        file_id = self.covers.file_ids.get(anime_id)
+        if file_id:
+            return InlineQueryResultCachedPhoto(
+                id=str(anime_id), photo_file_id=file_id, title=title, description=description,
+                caption=formatted_text, parse_mode='HTML'
+            )
+        if cover_url and self.covers.availability.get(anime_id) is not False:
+            return InlineQueryResultPhoto(
+                id=str(anime_id), photo_url=cover_url, thumbnail_url=cover_url, title=title,
+                description=description, caption=formatted_text, parse_mode='HTML'
+            )
+        return InlineQueryResultArticle(
+            id=str(anime_id), title=title, description=description,
+            input_message_content=InputTextMessageContent(
+                formatted_text, parse_mode='HTML', disable_web_page_preview=True
+            )
+        )
+
+    @staticmethod
+    def _button_label(label):
+        return label if len(label) <= 50 else label[:47] + "..."
+
     def _create_search_keyboard(self, results, user_id, current_page, page_info):
         """Create inline keyboard for search results with pagination"""
         keyboard = []
@@ -391,9 +3185,7 @@ Or simply send an anime title to search!"""
         for anime in results:
             title = anime["title"]["english"] or anime["title"]["romaji"]
             format_type = anime.get("format", "Unknown")
-            label = f"{title} ({format_type})"
-            if len(label) > 50:
-                label = label[:47] + "..."
+            label = self._button_label(f"{title} ({format_type})")
             keyboard.append([InlineKeyboardButton(label, callback_data=f"select_{anime['id']}")])
 
         pagination_row = []
@@ -442,7 +3234,7 @@ Or simply send an anime title to search!"""
 
     async def _handle_anime_selection(self, query, anime_id):
         """Handle when user selects an anime from search results"""
-        anime = self.anime_search.get_anime_by_id(anime_id)
+        anime = await self.anime_search.get_anime_by_id(anime_id)
 
         if not anime:
             await query.edit_message_text("❌ Couldn't load anime details.")
@@ -451,52 +3243,51 @@ Or simply send an anime title to search!"""
         # Format the anime data in the same style as manual input
         formatted_text, cover_url = self._format_anime_from_api(anime, anime_id)
 
-        # Send message with cover photo if available
-        if cover_url:
-            try:
-                # Test if the cover URL is accessible
-                test_response = requests.head(cover_url, timeout=5)
-                if test_response.status_code == 200:
-                    await query.message.reply_photo(
-                        photo=cover_url,
-                        caption=formatted_text,
-                        parse_mode='HTML'
-                    )
-                    await query.edit_message_text("✅ Anime formatted successfully!")
-                else:
-                    # If cover URL doesn't work, send text only
-                    logger.warning(f"Cover URL not accessible: {cover_url}")
-                    await query.message.reply_text(
-                        formatted_text,
-                        parse_mode='HTML',
-                        disable_web_page_preview=True
-                    )
-                    await query.edit_message_text("✅ Anime formatted (cover image not available)")
-            except Exception as e:
-                logger.warning(f"Could not send photo, sending text only: {str(e)}")
-                await query.message.reply_text(
-                    formatted_text,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True
-                )
-                await query.edit_message_text("✅ Anime formatted (without cover)")
+        with_cover = await self._send_post(query.message, anime_id, formatted_text, cover_url)
+        if with_cover:
+            await query.edit_message_text("✅ Anime formatted successfully!")
+        elif cover_url:
+            await query.edit_message_text("✅ Anime formatted (cover image not available)")
         else:
-            await query.message.reply_text(
-                formatted_text,
-                parse_mode='HTML',
-                disable_web_page_preview=True
-            )
             await query.edit_message_text("✅ Anime formatted (no cover available)")
 
+    async def _send_post(self, message, anime_id, formatted_text, cover_url):
+        """Reply with a formatted post, with its cover when possible; True if the cover was sent"""
+        # Send with cover photo, reusing an uploaded file_id when we have one
+        for photo in self.covers.photo_candidates(anime_id, cover_url):
+            try:
+                sent = await message.reply_photo(
+                    photo=photo,
+                    caption=formatted_text,
+                    parse_mode='HTML'
+                )
+                self.covers.remember_upload(anime_id, sent)
+                return True
+            except BadRequest as e:
+                if not self.covers.is_cover_error(e):
+                    raise
+                logger.warning(f"Cover rejected for anime {anime_id}, trying next option: {str(e)}")
+                self.covers.mark_failed(anime_id, photo, cover_url)
+            except TelegramError as e:
+                logger.warning(f"Could not send photo, sending text only: {str(e)}")
+                break
+
+        await message.reply_text(
+            formatted_text,
+            parse_mode='HTML',
+            disable_web_page_preview=True
+        )
+        return False
+
     async def _handle_page_change(self, query, user_id, page_number):
         """Handle pagination in search results"""
-        session = self.user_sessions.get(user_id)
+        session = await self.user_sessions.get(user_id)
         if not session:
             await query.edit_message_text("❌ Search session expired. Please search again.")
             return
 
         # Search for the new page
-        result = self.anime_search.search_anime(session["query"], page=page_number)
+        result = await self.anime_search.search_anime(session["query"], page=page_number)
 
         if not result or not result.get("media"):
             await query.edit_message_text("❌ No results found for this page.")
@@ -504,8 +3295,8 @@ Or simply send an anime title to search!"""
 
         # Update session
         session["current_page"] = page_number
-        session["results"] = result["media"]
-        self.user_sessions[user_id] = session
+        session["total_pages"] = result["pageInfo"]["lastPage"]
+        await self.user_sessions.set(user_id, session)
 
         # Create new keyboard
         keyboard = self._create_search_keyboard(result["media"], user_id, page_number, result["pageInfo"])
@@ -517,71 +3308,44 @@ Or simply send an anime title to search!"""
             parse_mode='HTML'
         )
 
+        if PREFETCH_ENABLED:
+            self.prefetcher.schedule(user_id, session["query"], page_number, session["total_pages"])
+
     def _format_anime_from_api(self, anime, anime_id=None):
         """Format anime data from API into the desired format"""
-        title = anime["title"]["english"] or anime["title"]["romaji"]
-        description = anime.get("description", "No synopsis available.")
-        description = re.sub(r'<.*?>', '', description)  # Remove HTML tags
-        description = description.replace('\n', ' ').strip()
-        
-        episodes = str(anime.get("episodes", "—")) if anime.get("episodes") else "—"
-
-        # USING YOUR ORIGINAL COVER URL GENERATION
-        cover_url = None
-        if anime_id:
-            cover_url = f"{ANILIST_IMG_CDN}/media/{anime_id}"
-    
-        # Use formatter to format
-        manual_format_text = f"""{title}
+        key = render_cache_key(anime, anime_id)
+        rendered = self.render_cache.get(key)
+        if rendered is not None:
+            return rendered
 
-‣ Genres : {', '.join(anime.get('genres', ['Sample']))}
-‣ Type : {anime.get('format', 'TV')}
-‣ Average Rating : {anime.get('averageScore', '100')}
-‣ Status : {anime.get('status', 'Unknown').replace('_', ' ')}
-‣ First aired : {self._format_date(anime.get('startDate', {}))}
-‣ Last aired : {self._format_date(anime.get('endDate', {}))}
-‣ Runtime : {anime.get('duration', '24')} min
-‣ No of episodes : {episodes}
+        record = AnimeRecord.from_media(anime)
 
-‣ Synopsis : {description}
-
-(Source: AniList)"""
-
-        anime_data = self.formatter.parse_anime_info(manual_format_text)
-        if anime_data:
-            return self.formatter.format_html(anime_data, cover_url, anime_id)
-        else:
-            # Fallback format with YOUR ORIGINAL iltac conversion
-            synopsis = self.formatter.truncate_synopsis(description)
-            return f"""<b>{title}</b>
-────────────────────────
-<b>➤ Season :</b> <code>1</code>
-<b>➢ Audio :</b> <code>Jap • Eng • Hin • Tel • Tam</code>
-<b>➤ Quality :</b><code> 480ᴘ • 720ᴘ • 1080ᴘ</code>
-<b>➥ Episodes :</b> {episodes}
-<blockquote expandable><b>➟ sʏɴᴏᴘsɪs :</b> <i>{synopsis}</i></blockquote>
-────────────────────────
-💠 <b>Powered By</b> : @OtakusFlix""", cover_url
-
-    def _format_date(self, date_dict):
-        """Format date from API response"""
-        if not date_dict or not date_dict.get("year"):
-            return "Unknown"
-
-        year = date_dict["year"]
-        month = date_dict.get("month", 1)
-        day = date_dict.get("day", 1)
-
-        return f"{year}-{month:02d}-{day:02d}"
+        # USING YOUR ORIGINAL COVER URL GENERATION
+        rendered = self.formatter.format_html(record, anime_id=anime_id)
+        self.render_cache.set(key, rendered)
+        return rendered
+
+    async def _render_media_batch(self, media_list):
+        """(caption, cover_url) per Media object; only render-cache misses go to the pool"""
+        keys = [render_cache_key(media) for media in media_list]
+        rendered = [self.render_cache.get(key) for key in keys]
+        missing = [i for i, value in enumerate(rendered) if value is None]
+        if missing:
+            fresh = await self.format_pool.map(render_media, [media_list[i] for i in missing])
+            for i, value in zip(missing, fresh):
+                rendered[i] = value
+                self.render_cache.set(keys[i], value)
+        return rendered
 
     def setup_handlers(self):
         self.application.add_handler(CommandHandler("start", self.start_command))
+        self.application.add_handler(CommandHandler("bulk", self.handle_bulk))
 
         # Add handler for manual formatting (specific pattern)
         self.application.add_handler(
             MessageHandler(
                 filters.TEXT & 
-                filters.Regex(r'‣\s*Genres\s*:') &  # Match the manual format pattern
+                filters.Regex(MANUAL_FIELD_LINE_PATTERN) &  # Match the manual format pattern
                 ~filters.COMMAND, 
                 self.handle_manual_format
             )
@@ -591,37 +3355,315 @@ Or simply send an anime title to search!"""
         self.application.add_handler(
             MessageHandler(
                 filters.TEXT & 
-                ~filters.Regex(r'‣\s*Genres\s*:') &  # Not manual format
+                ~filters.Regex(MANUAL_FIELD_LINE_PATTERN) &  # Not manual format
                 ~filters.COMMAND, 
                 self.handle_search
             )
         )
 
         self.application.add_handler(CallbackQueryHandler(self.handle_callback_query))
+        self.application.add_handler(InlineQueryHandler(self.handle_inline_query))
+
+    async def _run_webhook(self, socket_path=None):
+        """Serve updates from the embedded webhook server until SIGINT/SIGTERM
+
+        With `socket_path` this is a sharded worker: it takes updates from the
+        ingress on a unix socket and leaves webhook registration to it.
+        """
+        application = self.application
+        server = WebhookServer(application, graphql_stats=self.anime_search.stats,
+                               secret="" if socket_path else WEBHOOK_SECRET, socket_path=socket_path)
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        # post_init/post_shutdown only run automatically with run_polling/run_webhook
+        await application.initialize()
+        await self._post_init(application)
+        await application.start()
+        await server.start()
+
+        try:
+            if socket_path is None:
+                await register_webhook(application.bot)
+
+            await stop_event.wait()
+            logger.info("Shutting down, draining queued updates...")
+        finally:
+            # The webhook stays registered so Telegram holds new updates for the next start
+            await server.drain()
+            await server.stop()
+            await application.stop()
+            await application.shutdown()
+            await self._post_shutdown(application)
 
     def run(self):
-        """Run the bot in polling mode"""
+        """Run the bot in polling or webhook mode"""
         logger.info("🤖 Anime Formatter Bot is starting...")
-        logger.info(f"Using GraphQL API: {GRAPHQL_API_URL}")
+        logger.info(f"Using GraphQL API endpoints: {', '.join(GRAPHQL_API_URLS)}")
         logger.info(f"Using AniList CDN for cover images: {ANILIST_IMG_CDN}")
         try:
-            # Test API connection
-            test_result = self.anime_search.search_anime("naruto", page=1, per_page=1)
-            if test_result:
-                logger.info("✅ GraphQL API connection successful!")
+            if BOT_MODE == "webhook":
+                asyncio.run(self._run_webhook())
             else:
-                logger.warning("⚠️ GraphQL API test failed, but continuing anyway...")
-            
-            self.application.run_polling(
-                allowed_updates=Update.ALL_TYPES,
-                drop_pending_updates=True
-            )
+                self.application.run_polling(
+                    allowed_updates=Update.ALL_TYPES,
+                    drop_pending_updates=DROP_PENDING_UPDATES
+                )
         except Exception as e:
             logger.error(f"Failed to start bot: {str(e)}")
             raise
 
+def shard_for_update(data, shards):
+    """Worker index for a raw update, by sender (else chat) id so each user stays on one worker"""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        for owner in (value.get("from"), value.get("user"), value.get("chat")):
+            if isinstance(owner, dict) and isinstance(owner.get("id"), int):
+                return owner["id"] % shards
+    return data.get("update_id", 0) % shards
+
+def run_shard_worker(shard, shards, socket_path):
+    """Process entry point of one BOT_MODE=sharded worker"""
+    logger.info(f"Shard worker {shard} of {shards} starting (pid {os.getpid()})")
+    asyncio.run(TelegramBot(shard=shard, shards=shards)._run_webhook(socket_path=socket_path))
+
+class ShardRouter:
+    """Webhook ingress for BOT_MODE=sharded
+
+    Starts `workers` processes, each a full TelegramBot serving webhook
+    updates on its own unix socket, and forwards every update to the
+    worker that owns its user. Workers that exit are restarted, with
+    exponential backoff while they keep crashing; until one is back its
+    updates get a 503, which Telegram retries, and /healthz lists it as down.
+    """
+
+    SECRET_HEADER = WebhookServer.SECRET_HEADER
+
+    def __init__(self, workers=SHARD_WORKERS, socket_dir=SHARD_SOCKET_DIR, path=WEBHOOK_PATH,
+                 secret=WEBHOOK_SECRET, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT):
+        self.workers = max(1, workers)
+        self.socket_dir = socket_dir
+        self.path = path
+        self.secret = secret
+        self.listen = listen
+        self.port = port
+        self.accepting = True
+        self.forwarded = [0] * self.workers
+        self.failed = 0
+        self.rejected = 0
+        self.restarts = 0
+        self._context = multiprocessing.get_context("spawn")
+        self._processes = [None] * self.workers
+        self._started = [0.0] * self.workers  # monotonic spawn time per shard
+        self._crashes = [0] * self.workers  # consecutive exits soon after starting
+        self._restart_at = [None] * self.workers  # set while an exited worker waits for its restart
+        self._sessions = []  # one per worker socket
+        self._runner = None
+        self.web_app = web.Application()
+        self.web_app.router.add_post(path, self.handle_update)
+        self.web_app.router.add_get("/healthz", self.handle_health)
+        self._register_metrics()
+
+    def _register_metrics(self):
+        METRICS.callback("animebot_shard_forwarded_total", "Updates handed to each worker",
+                         lambda: {(str(shard),): count for shard, count in enumerate(self.forwarded)},
+                         ("shard",), "counter")
+        METRICS.callback("animebot_shard_forward_failures_total", "Updates refused because their worker was down",
+                         lambda: self.failed, type="counter")
+        METRICS.callback("animebot_shard_restarts_total", "Worker processes restarted after exiting",
+                         lambda: self.restarts, type="counter")
+        METRICS.callback("animebot_shards_down", "Worker processes not running",
+                         lambda: len(self.down_shards()))
+
+    def socket_path(self, shard):
+        return os.path.join(self.socket_dir, f"worker-{shard}.sock")
+
+    def _spawn(self, shard):
+        process = self._context.Process(
+            target=run_shard_worker, args=(shard, self.workers, self.socket_path(shard)),
+            name=f"animebot-shard-{shard}"
+        )
+        process.start()
+        self._processes[shard] = process
+        self._started[shard] = time.monotonic()
+        self._restart_at[shard] = None
+
+    def down_shards(self):
+        """Shards whose worker process has exited and not been restarted yet"""
+        return [shard for shard, process in enumerate(self._processes)
+                if process is not None and not process.is_alive()]
+
+    async def handle_update(self, request):
+        if self.secret and not hmac.compare_digest(request.headers.get(self.SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=403, text="invalid secret token")
+
+        if not self.accepting:
+            return web.Response(status=503, text="shutting down")
+
+        body = await request.read()
+        try:
+            shard = shard_for_update(json_loads(body), self.workers)
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Rejected malformed webhook update: {str(e)}")
+            return web.Response(status=400, text="malformed update")
+
+        # The worker answers once the update is queued, so a user's updates keep their order
+        try:
+            async with self._sessions[shard].post(
+                f"http://shard-{shard}{self.path}", data=body, headers={"Content-Type": "application/json"}
+            ) as response:
+                status, text = response.status, await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.failed += 1
+            logger.warning(f"Shard worker {shard} unavailable: {str(e)}")
+            return web.Response(status=503, text="worker unavailable")
+
+        if status == 200:
+            self.forwarded[shard] += 1
+        return web.Response(status=status, text=text)
+
+    async def _worker_health(self, shard):
+        try:
+            async with self._sessions[shard].get(f"http://shard-{shard}/healthz") as response:
+                return await response.json()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+    async def handle_health(self, request):
+        workers = await asyncio.gather(*(self._worker_health(shard) for shard in range(self.workers)))
+        if not self.accepting:
+            status = "draining"
+        else:
+            status = "ok" if all(workers) else "degraded"
+        return web.json_response({
+            "status": status,
+            "forwarded": self.forwarded,
+            "failed": self.failed,
+            "restarts": self.restarts,
+            "down": self.down_shards(),
+            "workers": workers
+        })
+
+    async def start(self):
+        """Start the workers, wait for their sockets, then take updates"""
+        os.makedirs(self.socket_dir, exist_ok=True)
+        for shard in range(self.workers):
+            if os.path.exists(self.socket_path(shard)):
+                os.unlink(self.socket_path(shard))
+            self._spawn(shard)
+
+        timeout = aiohttp.ClientTimeout(total=GRAPHQL_TIMEOUT)
+        self._sessions = [
+            aiohttp.ClientSession(connector=aiohttp.UnixConnector(path=self.socket_path(shard)), timeout=timeout)
+            for shard in range(self.workers)
+        ]
+
+        deadline = time.monotonic() + SHARD_START_TIMEOUT
+        pending = set(range(self.workers))
+        while pending and time.monotonic() < deadline:
+            pending = {shard for shard in pending if not os.path.exists(self.socket_path(shard))}
+            await asyncio.sleep(0.1)
+        if pending:
+            logger.warning(f"Shard workers {sorted(pending)} not ready after {SHARD_START_TIMEOUT:.0f}s")
+
+        self._runner = web.AppRunner(self.web_app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Shard ingress listening on {self.listen}:{self.port}{self.path} "
+                    f"with {self.workers} workers")
+
+    async def _supervise(self):
+        """Restart workers that exit while updates are still being taken, backing off on repeated crashes"""
+        while self.accepting:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for shard, process in enumerate(self._processes):
+                if not self.accepting or process.is_alive():
+                    continue
+                if self._restart_at[shard] is None:
+                    # Crashing on startup (bad token, unwritable paths) doubles the wait each time
+                    if now - self._started[shard] < SHARD_START_TIMEOUT:
+                        self._crashes[shard] += 1
+                    else:
+                        self._crashes[shard] = 1
+                    delay = min(SHARD_RESTART_MAX_DELAY, SHARD_RESTART_DELAY * 2 ** (self._crashes[shard] - 1))
+                    self._restart_at[shard] = now + delay
+                    logger.error(f"Shard worker {shard} exited with code {process.exitcode}, "
+                                 f"restarting in {delay:.0f}s")
+                elif now >= self._restart_at[shard]:
+                    self.restarts += 1
+                    self._spawn(shard)
+
+    async def stop(self):
+        """Stop taking updates, then let every worker drain its queue and exit"""
+        self.accepting = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+        processes = [process for process in self._processes if process is not None]
+        for process in processes:
+            if process.is_alive():
+                process.terminate()  # SIGTERM: the worker drains like a webhook-mode bot
+
+        def join():
+            deadline = time.monotonic() + WEBHOOK_DRAIN_TIMEOUT + 15
+            for process in processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+
+        await asyncio.to_thread(join)
+        for process in processes:
+            if process.is_alive():
+                logger.warning(f"{process.name} did not exit in time, killing it")
+                process.kill()
+
+        for session in self._sessions:
+            await session.close()
+        self._sessions = []
+
+    async def run(self):
+        """Route updates until SIGINT/SIGTERM"""
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass
+
+        metrics_server = MetricsServer() if METRICS_PORT else None
+        await self.start()
+        supervisor = asyncio.create_task(self._supervise())
+        try:
+            if metrics_server is not None:
+                await metrics_server.start()
+            async with Bot(BOT_TOKEN, base_url=TELEGRAM_API_BASE_URL, base_file_url=TELEGRAM_API_FILE_URL) as bot:
+                await register_webhook(bot)
+
+            await stop_event.wait()
+            logger.info("Shutting down, draining shard workers...")
+        finally:
+            supervisor.cancel()
+            await asyncio.gather(supervisor, return_exceptions=True)
+            await self.stop()
+            if metrics_server is not None:
+                await metrics_server.stop()
+
 def main():
     try:
+        if BOT_MODE == "sharded":
+            # The ingress only routes updates; each worker builds its own TelegramBot
+            logger.info(f"🤖 Anime Formatter Bot is starting with {SHARD_WORKERS} shard workers...")
+            asyncio.run(ShardRouter().run())
+            return
         bot = TelegramBot()
         bot.run()
     except KeyboardInterrupt: